@@ -0,0 +1,99 @@
+import multiprocessing
+import queue
+
+from config import Config
+from session_tuning import SESSION_SETTING_INTRA_OP_THREADS
+from session_tuning import SESSION_SETTING_INTER_OP_THREADS
+from session_tuning import SESSION_SETTING_USE_PER_SESSION_THREADS
+
+# Messages from a probe process to the parent
+PROBE_MESSAGE_RESULT = 'result'
+PROBE_MESSAGE_FAILED = 'failed'
+
+# Seconds to wait a message before checking the probe process is alive
+PROBE_POLL_SECONDS = 1
+
+# Session settings which size the TF thread pools of a process, The pools
+# are created by the first session of the process and shared by later ones
+THREAD_SETTING_KEYS = [
+    SESSION_SETTING_INTRA_OP_THREADS,
+    SESSION_SETTING_INTER_OP_THREADS,
+    SESSION_SETTING_USE_PER_SESSION_THREADS,
+]
+
+
+# Entry of a probe process, Measures images/sec of each requested
+# (session settings, batch size, concurrent runs) until None is received
+def _run_probe(saved_model_path, data_path, sample_group, request_queue, result_queue):
+    # Imported here, test_session imports this module
+    from test_session import TestSession
+
+    session = TestSession(config=Config())
+    for session_settings, batch_size, concurrent_runs in iter(request_queue.get, None):
+        try:
+            result_queue.put((PROBE_MESSAGE_RESULT, session.probe_throughput(
+                saved_model_path, session_settings, data_path, sample_group,
+                batch_size, concurrent_runs)))
+        except Exception as e:
+            result_queue.put((PROBE_MESSAGE_FAILED, str(e)))
+
+
+# Measure throughput of a saved model in probe processes, A process is
+# started for each thread settings, so the thread pools are sized by the
+# probed settings (not by the first session of the app). Probes of same
+# thread settings share the process
+class ProbeRunner(object):
+
+    def __init__(self, saved_model_path, data_path, sample_group):
+        self._saved_model_path = saved_model_path
+        self._data_path = data_path
+        self._sample_group = sample_group
+        # Spawn (not fork) processes, TF and Qt of the parent can't be forked
+        self._context = multiprocessing.get_context('spawn')
+        self._thread_settings = None
+        self._process = None
+        self._request_queue = None
+        self._result_queue = None
+
+    # Returns images/sec, Raises RuntimeError if the probe failed
+    def measure(self, session_settings, batch_size, concurrent_runs):
+        thread_settings = tuple(session_settings[key] for key in THREAD_SETTING_KEYS)
+        if self._process is None or thread_settings != self._thread_settings:
+            self.close()
+            self._start()
+            self._thread_settings = thread_settings
+
+        self._request_queue.put((dict(session_settings), batch_size, concurrent_runs))
+        while True:
+            try:
+                message = self._result_queue.get(timeout=PROBE_POLL_SECONDS)
+                break
+            except queue.Empty:
+                if not self._process.is_alive():
+                    self._process = None
+                    raise RuntimeError('The probe process exited')
+
+        if message[0] == PROBE_MESSAGE_FAILED:
+            raise RuntimeError(message[1])
+        return message[1]
+
+    def close(self):
+        if self._process is None:
+            return
+
+        self._request_queue.put(None)
+        self._process.join(timeout=PROBE_POLL_SECONDS * 10)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+        self._process = None
+
+    def _start(self):
+        self._request_queue = self._context.Queue()
+        self._result_queue = self._context.Queue()
+        self._process = self._context.Process(
+            target=_run_probe,
+            args=(self._saved_model_path, self._data_path, self._sample_group,
+                  self._request_queue, self._result_queue),
+            daemon=True)
+        self._process.start()
@@ -1,12 +1,87 @@
 # Containing configuration data for testing
 from PyQt5.QtCore import QSettings
 
+import os
+
 CONFIG_KEY_SAVED_MODEL_PATH = 'saved_model_path'
 CONFIG_KEY_LABEL_MAP_PATH = 'label_map_path'
 CONFIG_KEY_TEST_DATA_PATH = 'test_data_path'
 
 CONFIG_KEY_RESULT_CUTOFF_THRESHOLD = 'result_cutoff_thres'
 
+# Feed the jpeg bytes on disk to the model as it is (no decode/encode)
+CONFIG_KEY_FEED_RAW_IMAGE_BYTES = 'feed_raw_image_bytes'
+
+# Encoder for ndarray inputs (format: `jpg` or `png`, quality: 0~100 for jpg)
+CONFIG_KEY_ENCODER_FORMAT = 'encoder_format'
+CONFIG_KEY_ENCODER_QUALITY = 'encoder_quality'
+
+# Number of images packed into a sess.run (Images in a batch must have same size)
+CONFIG_KEY_BATCH_SIZE = 'batch_size'
+
+# Background loading of test images (Images loaded ahead and loader threads)
+CONFIG_KEY_PREFETCH_DEPTH = 'prefetch_depth'
+CONFIG_KEY_PREFETCH_LOADERS = 'prefetch_loaders'
+
+# Number of batches running on the session at a time (sess.run is thread safe)
+CONFIG_KEY_CONCURRENT_RUNS = 'concurrent_runs'
+
+# Input pipeline for group prediction (`python` or `dataset`)
+CONFIG_KEY_INPUT_PIPELINE = 'input_pipeline'
+INPUT_PIPELINE_PYTHON = 'python'
+INPUT_PIPELINE_DATASET = 'dataset'
+
+# Memory budget (MB) of loaded models kept for switching between models
+CONFIG_KEY_MODEL_CACHE_BUDGET_MB = 'model_cache_budget_mb'
+
+# Directory to keep cache files of the test suite
+CONFIG_KEY_CACHE_PATH = 'cache_path'
+
+# Persistent cache of inference outputs by model and image content
+CONFIG_KEY_INFERENCE_CACHE_ENABLED = 'inference_cache_enabled'
+CONFIG_KEY_INFERENCE_CACHE_BUDGET_MB = 'inference_cache_budget_mb'
+CONFIG_KEY_INFERENCE_CACHE_MAX_AGE_DAYS = 'inference_cache_max_age_days'
+
+# Emit the result of each group as soon as the group is finished
+CONFIG_KEY_STREAM_GROUP_RESULTS = 'stream_group_results'
+
+# Spill raw outputs to the cache directory and keep only aggregates in memory
+CONFIG_KEY_BOUNDED_MEMORY = 'bounded_memory'
+
+# Journal finished images of a run to resume it after a crash (off by
+# default, raw detections of all images are written to the cache directory)
+CONFIG_KEY_RUN_JOURNAL_ENABLED = 'run_journal_enabled'
+
+# Reuse hashes of unchanged images (by size and mtime) so only new or
+# changed images are read and inferred, the rest come from the inference cache
+CONFIG_KEY_INCREMENTAL_RETEST = 'incremental_retest'
+
+# Number of threads listing group directories of the test data
+CONFIG_KEY_DATASET_SCAN_WORKERS = 'dataset_scan_workers'
+
+# Number of processes running test groups (1: run in the worker thread)
+# and intra op threads of each process (0: cores / processes)
+CONFIG_KEY_SHARD_COUNT = 'shard_count'
+CONFIG_KEY_SHARD_INTRA_OP_THREADS = 'shard_intra_op_threads'
+
+# TF session settings (0 threads: TF default, optimizer level: 'L0' or 'L1')
+CONFIG_KEY_INTRA_OP_PARALLELISM_THREADS = 'intra_op_parallelism_threads'
+CONFIG_KEY_INTER_OP_PARALLELISM_THREADS = 'inter_op_parallelism_threads'
+CONFIG_KEY_GRAPH_OPTIMIZER_LEVEL = 'graph_optimizer_level'
+CONFIG_KEY_XLA_JIT = 'xla_jit'
+CONFIG_KEY_USE_PER_SESSION_THREADS = 'use_per_session_threads'
+
+# Use settings found by autotune for the model instead of above settings
+CONFIG_KEY_USE_TUNED_SESSION_SETTINGS = 'use_tuned_session_settings'
+
+# Use batch size and concurrent runs found by autotune for the model
+# (off by default, they are tuned with a few sample images)
+CONFIG_KEY_USE_TUNED_RUN_SETTINGS = 'use_tuned_run_settings'
+
+# Load the graph optimized for prediction (frozen, pruned and constants
+# folded) from the cache directory instead of the saved model
+CONFIG_KEY_OPTIMIZED_GRAPH_ENABLED = 'optimized_graph_enabled'
+
 
 # Store configuration (Singleton)
 class Config(object):
@@ -20,6 +95,11 @@ class Config(object):
     def set(self, key, value):
         self._settings.setValue(key, value)
 
+    def get_cache_file_path(self, file_name):
+        cache_path = self.get(CONFIG_KEY_CACHE_PATH)
+        os.makedirs(cache_path, exist_ok=True)
+        return os.path.join(cache_path, file_name)
+
     def is_valid(self):
         return (
             self.get(CONFIG_KEY_LABEL_MAP_PATH) is not None and
@@ -29,3 +109,60 @@ class Config(object):
     def check_default(self):
         if not self._settings.contains(CONFIG_KEY_RESULT_CUTOFF_THRESHOLD):
             self.set(CONFIG_KEY_RESULT_CUTOFF_THRESHOLD, 0.5)
+        if not self._settings.contains(CONFIG_KEY_FEED_RAW_IMAGE_BYTES):
+            self.set(CONFIG_KEY_FEED_RAW_IMAGE_BYTES, True)
+        if not self._settings.contains(CONFIG_KEY_ENCODER_FORMAT):
+            self.set(CONFIG_KEY_ENCODER_FORMAT, 'jpg')
+        if not self._settings.contains(CONFIG_KEY_ENCODER_QUALITY):
+            self.set(CONFIG_KEY_ENCODER_QUALITY, 95)
+        if not self._settings.contains(CONFIG_KEY_BATCH_SIZE):
+            self.set(CONFIG_KEY_BATCH_SIZE, 1)
+        if not self._settings.contains(CONFIG_KEY_PREFETCH_DEPTH):
+            self.set(CONFIG_KEY_PREFETCH_DEPTH, 32)
+        if not self._settings.contains(CONFIG_KEY_PREFETCH_LOADERS):
+            self.set(CONFIG_KEY_PREFETCH_LOADERS, 4)
+        if not self._settings.contains(CONFIG_KEY_CONCURRENT_RUNS):
+            self.set(CONFIG_KEY_CONCURRENT_RUNS, 1)
+        if not self._settings.contains(CONFIG_KEY_INPUT_PIPELINE):
+            self.set(CONFIG_KEY_INPUT_PIPELINE, INPUT_PIPELINE_PYTHON)
+        if not self._settings.contains(CONFIG_KEY_MODEL_CACHE_BUDGET_MB):
+            self.set(CONFIG_KEY_MODEL_CACHE_BUDGET_MB, 2048)
+        if not self._settings.contains(CONFIG_KEY_CACHE_PATH):
+            self.set(CONFIG_KEY_CACHE_PATH, os.path.join(
+                os.path.expanduser('~'), '.tf_od_test_suite'))
+        if not self._settings.contains(CONFIG_KEY_INFERENCE_CACHE_ENABLED):
+            self.set(CONFIG_KEY_INFERENCE_CACHE_ENABLED, True)
+        if not self._settings.contains(CONFIG_KEY_INFERENCE_CACHE_BUDGET_MB):
+            self.set(CONFIG_KEY_INFERENCE_CACHE_BUDGET_MB, 1024)
+        if not self._settings.contains(CONFIG_KEY_INFERENCE_CACHE_MAX_AGE_DAYS):
+            self.set(CONFIG_KEY_INFERENCE_CACHE_MAX_AGE_DAYS, 30)
+        if not self._settings.contains(CONFIG_KEY_STREAM_GROUP_RESULTS):
+            self.set(CONFIG_KEY_STREAM_GROUP_RESULTS, True)
+        if not self._settings.contains(CONFIG_KEY_BOUNDED_MEMORY):
+            self.set(CONFIG_KEY_BOUNDED_MEMORY, False)
+        if not self._settings.contains(CONFIG_KEY_RUN_JOURNAL_ENABLED):
+            self.set(CONFIG_KEY_RUN_JOURNAL_ENABLED, False)
+        if not self._settings.contains(CONFIG_KEY_INCREMENTAL_RETEST):
+            self.set(CONFIG_KEY_INCREMENTAL_RETEST, True)
+        if not self._settings.contains(CONFIG_KEY_DATASET_SCAN_WORKERS):
+            self.set(CONFIG_KEY_DATASET_SCAN_WORKERS, 8)
+        if not self._settings.contains(CONFIG_KEY_SHARD_COUNT):
+            self.set(CONFIG_KEY_SHARD_COUNT, 1)
+        if not self._settings.contains(CONFIG_KEY_SHARD_INTRA_OP_THREADS):
+            self.set(CONFIG_KEY_SHARD_INTRA_OP_THREADS, 0)
+        if not self._settings.contains(CONFIG_KEY_INTRA_OP_PARALLELISM_THREADS):
+            self.set(CONFIG_KEY_INTRA_OP_PARALLELISM_THREADS, 0)
+        if not self._settings.contains(CONFIG_KEY_INTER_OP_PARALLELISM_THREADS):
+            self.set(CONFIG_KEY_INTER_OP_PARALLELISM_THREADS, 0)
+        if not self._settings.contains(CONFIG_KEY_GRAPH_OPTIMIZER_LEVEL):
+            self.set(CONFIG_KEY_GRAPH_OPTIMIZER_LEVEL, 'L1')
+        if not self._settings.contains(CONFIG_KEY_XLA_JIT):
+            self.set(CONFIG_KEY_XLA_JIT, False)
+        if not self._settings.contains(CONFIG_KEY_USE_PER_SESSION_THREADS):
+            self.set(CONFIG_KEY_USE_PER_SESSION_THREADS, False)
+        if not self._settings.contains(CONFIG_KEY_USE_TUNED_SESSION_SETTINGS):
+            self.set(CONFIG_KEY_USE_TUNED_SESSION_SETTINGS, True)
+        if not self._settings.contains(CONFIG_KEY_USE_TUNED_RUN_SETTINGS):
+            self.set(CONFIG_KEY_USE_TUNED_RUN_SETTINGS, False)
+        if not self._settings.contains(CONFIG_KEY_OPTIMIZED_GRAPH_ENABLED):
+            self.set(CONFIG_KEY_OPTIMIZED_GRAPH_ENABLED, True)
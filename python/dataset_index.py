@@ -0,0 +1,50 @@
+import hashlib
+import json
+import os
+
+
+# File name of the index of a test data directory in the cache directory
+def get_dataset_index_file_name(test_data_path):
+    return 'dataset_index_{}.json'.format(hashlib.sha1(
+        os.path.abspath(test_data_path).encode('utf-8')).hexdigest())
+
+
+# Index of images in a test data directory by relative path with
+# (size, mtime_ns, SHA-256 of image). The hash of an image is reused while
+# its size and mtime are same, so unchanged images are not read to find
+# their outputs in the inference cache.
+class DatasetIndex(object):
+
+    def __init__(self, path):
+        self._path = path
+        self._entries = dict()
+        self._new_entries = dict()
+        try:
+            with open(path, mode='r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    # Add an image of the current test data, Returns its hash if the image
+    # is not changed or None. Images which are not added (removed from the
+    # test data) are dropped when it is saved
+    def add(self, relpath, size, mtime_ns):
+        image_hash = None
+        entry = self._entries.get(relpath)
+        if entry is not None and entry[0] == size and entry[1] == mtime_ns:
+            image_hash = entry[2]
+        self._new_entries[relpath] = [size, mtime_ns, image_hash]
+        return image_hash
+
+    def set_hash(self, relpath, image_hash):
+        if relpath in self._new_entries:
+            self._new_entries[relpath][2] = image_hash
+
+    def save(self):
+        entries = {relpath: entry for relpath, entry in self._new_entries.items()
+                   if entry[2] is not None}
+        with open(self._path + '.tmp', mode='w', encoding='utf-8') as f:
+            json.dump(entries, f)
+        os.replace(self._path + '.tmp', self._path)
+        self._entries = entries
+        self._new_entries = dict()
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Name of the file which has required classes in each group directory
+CLASSES_FILE_NAME = 'classes.json'
+
+# Directories modified in this period (seconds) are scanned again in the
+# next run, A change in the same mtime tick as the scan can't be detected
+MTIME_SETTLE_SECONDS = 2
+
+
+# File name of the manifest of a test data directory in the cache directory
+def get_dataset_manifest_file_name(test_data_path):
+    return 'dataset_manifest_{}.json'.format(hashlib.sha1(
+        os.path.abspath(test_data_path).encode('utf-8')).hexdigest())
+
+
+# Manifest of a test data directory, group name -> sorted jpeg images and
+# required classes. Directories are listed by `os.scandir` in parallel and
+# the manifest is kept in a file. A group is listed again only if the mtime
+# of its directory or its classes file is changed, and the group directories
+# are listed again only if the mtime of the test data directory is changed.
+# (size, mtime_ns) of images can be taken in the same scan, They are not
+# kept in the manifest (an image can be rewritten without changing the
+# mtime of its directory) and images are stat-ed in each run.
+class DatasetManifest(object):
+
+    def __init__(self, path, worker_count=8):
+        self._path = path
+        self._worker_count = max(1, worker_count)
+
+    # Returns {group name: {'test_data': images, 'classes': classes}} of
+    # groups which have jpeg images, in order of the group name. Each group
+    # also has 'image_stats', [size, mtime_ns] of images if `image_stats`
+    def load(self, test_data_path, image_stats=False):
+        manifest = self._read()
+        if manifest.get('root') != os.path.abspath(test_data_path):
+            manifest = {}
+        old_groups = manifest.get('groups', {})
+
+        root_mtime_ns = self._get_mtime_ns(test_data_path)
+        if root_mtime_ns is not None and root_mtime_ns == manifest.get('mtime_ns'):
+            group_names = list(old_groups.keys())
+        else:
+            with os.scandir(test_data_path) as entries:
+                group_names = [entry.name for entry in entries if entry.is_dir()]
+            root_mtime_ns = self._settle(root_mtime_ns)
+
+        with ThreadPoolExecutor(max_workers=self._worker_count) as executor:
+            scanned = dict(zip(group_names, executor.map(
+                lambda group_name: self._scan_group(
+                    os.path.join(test_data_path, group_name), old_groups.get(group_name),
+                    image_stats),
+                group_names)))
+        groups = {group_name: group for group_name, (group, _) in scanned.items()}
+
+        if root_mtime_ns != manifest.get('mtime_ns') or groups != old_groups:
+            self._write({
+                'root': os.path.abspath(test_data_path),
+                'mtime_ns': root_mtime_ns,
+                'groups': groups,
+            })
+
+        test_groups = dict()
+        for group_name, (group, group_image_stats) in sorted(scanned.items()):
+            if len(group['test_data']) == 0:
+                continue
+            test_groups[group_name] = {'test_data': list(group['test_data']),
+                                       'classes': list(group['classes'])}
+            if image_stats:
+                test_groups[group_name]['image_stats'] = group_image_stats
+
+        return test_groups
+
+    # Only support jpeg image, Returns (group, [size, mtime_ns] of images or
+    # None if not `image_stats`)
+    def _scan_group(self, group_path, old_group, image_stats=False):
+        mtime_ns = self._get_mtime_ns(group_path)
+        classes_mtime_ns = self._get_mtime_ns(
+            os.path.join(group_path, CLASSES_FILE_NAME))
+        if old_group is not None and mtime_ns is not None and \
+                old_group['mtime_ns'] == mtime_ns and \
+                old_group['classes_mtime_ns'] == classes_mtime_ns:
+            group_image_stats = None
+            if image_stats:
+                group_image_stats = [self._get_stat(os.stat(os.path.join(group_path, image_file)))
+                                     for image_file in old_group['test_data']]
+            return old_group, group_image_stats
+
+        with os.scandir(group_path) as entries:
+            image_entries = sorted((entry for entry in entries
+                                    if entry.name.lower().endswith('.jpg')),
+                                   key=lambda entry: entry.name)
+        image_file_list = [entry.name for entry in image_entries]
+        group_image_stats = None
+        if image_stats:
+            group_image_stats = [self._get_stat(entry.stat()) for entry in image_entries]
+
+        classes = []
+        if len(image_file_list) > 0:
+            with open(os.path.join(group_path, CLASSES_FILE_NAME), mode='r', encoding='utf-8') as f:
+                classes = json.load(f)['classes']
+
+        return {
+            'mtime_ns': self._settle(mtime_ns),
+            'classes_mtime_ns': classes_mtime_ns,
+            'test_data': image_file_list,
+            'classes': classes,
+        }, group_image_stats
+
+    def _get_stat(self, stat):
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _get_mtime_ns(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    # mtime (before listing) of recently modified directory is not kept
+    # to list it again
+    def _settle(self, mtime_ns):
+        if mtime_ns is None or time.time() - mtime_ns / 1e9 < MTIME_SETTLE_SECONDS:
+            return None
+        return mtime_ns
+
+    def _read(self):
+        try:
+            with open(self._path, mode='r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, manifest):
+        with open(self._path + '.tmp', mode='w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(self._path + '.tmp', self._path)
@@ -0,0 +1,47 @@
+r"""Pack test data of the TestSuite into one file.
+
+# The packed file is written to the test data directory by default and the
+# TestSuite reads images from it instead of the image files.
+# Pack the test data again after changing images or classes.json.
+
+Example usage:
+  python dataset_tools/create_packed_test_dataset.py \
+  --data_dir=/mnt/data/datasets/ShinhanCard_78/testsuite_data
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from packed_dataset import PACKED_DATASET_FILE_NAME
+from packed_dataset import pack_test_dataset
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_dir', required=True,
+                        help='Root directory of the test data (group directories).')
+    parser.add_argument('--out_path', default=None,
+                        help='Path to the packed file (default: <data_dir>/' +
+                        PACKED_DATASET_FILE_NAME + ')')
+    args = parser.parse_args()
+
+    out_path = args.out_path
+    if out_path is None:
+        out_path = os.path.join(args.data_dir, PACKED_DATASET_FILE_NAME)
+
+    # Write to a temporary file, The TestSuite may read the old one
+    index = pack_test_dataset(args.data_dir, out_path + '.tmp')
+    os.replace(out_path + '.tmp', out_path)
+
+    print('Packed {} groups, {} images to {}'.format(
+        len(index), sum(len(group['images']) for group in index.values()), out_path))
+
+
+if __name__ == '__main__':
+    main()
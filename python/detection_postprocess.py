@@ -0,0 +1,39 @@
+import numpy as np
+
+
+# Split batched `detection_*` outputs to the outputs of each image.
+# Types are converted once for the whole batch and the outputs of each
+# image are trimmed by its num_detections (views, not copies).
+def split_batch_outputs(output_dict):
+    # all outputs are float32 numpy arrays, so convert types as appropriate
+    num_detections = output_dict['num_detections'].astype(np.int64)
+    classes = output_dict['detection_classes'].astype(np.uint8)
+    boxes = output_dict['detection_boxes']
+    scores = output_dict['detection_scores']
+    masks = output_dict.get('detection_masks')
+
+    results = []
+    for index, count in enumerate(num_detections.tolist()):
+        result = {
+            'num_detections': count,
+            'detection_classes': classes[index, :count],
+            'detection_boxes': boxes[index, :count],
+            'detection_scores': scores[index, :count],
+        }
+        if masks is not None:
+            result['detection_masks'] = masks[index, :count]
+        results.append(result)
+
+    return results
+
+
+# Number of detections passing the threshold of each image in packed
+# outputs, Detections of image i are scores[offsets[i]:offsets[i+1]] and
+# are sorted by score in descending order, so it is also the cutoff index
+def get_cutoff_counts(scores, offsets, thres=0.5):
+    # Sentinel keeps reduceat in range for images without detection
+    passed = np.append(scores >= thres, False).astype(np.int64)
+    counts = np.add.reduceat(passed, offsets[:-1])
+    # reduceat gives an element (not zero) for empty segments
+    counts[offsets[:-1] == offsets[1:]] = 0
+    return counts
@@ -0,0 +1,34 @@
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Load items ahead of the consumer with loader threads.
+# At most `queue_depth` items are loaded or being loaded at a time, so the
+# loaders stop reading when the consumer (sess.run) falls behind.
+class ImagePrefetcher(object):
+
+    def __init__(self, load_func, items, queue_depth=32, loader_count=4):
+        if queue_depth < 1 or loader_count < 1:
+            raise ValueError('queue_depth and loader_count must be positive')
+
+        self._load_func = load_func
+        self._items = items
+        self._queue_depth = queue_depth
+        self._loader_count = loader_count
+
+    # Yields (item, loaded data) in the same order of given items
+    def __iter__(self):
+        with ThreadPoolExecutor(max_workers=self._loader_count) as executor:
+            pending = collections.deque()
+            for item in self._items:
+                if len(pending) >= self._queue_depth:
+                    yield self._pop_loaded(pending)
+                pending.append((item, executor.submit(self._load_func, item)))
+
+            while len(pending) > 0:
+                yield self._pop_loaded(pending)
+
+    def _pop_loaded(self, pending):
+        item, future = pending.popleft()
+        # Raise the exception of the loader here, in the consumer thread
+        return item, future.result()
@@ -0,0 +1,90 @@
+import sqlite3
+import time
+
+import numpy as np
+
+
+# Persistent cache of raw detection outputs keyed by
+# (model key, SHA-256 of image bytes). Outputs of unchanged images are
+# reused across runs and entries of unused models are evicted by age/size.
+# The connection must be used only in the thread which opened it.
+class InferenceCache(object):
+
+    def __init__(self, cache_file_path):
+        self._conn = sqlite3.connect(cache_file_path)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS outputs ('
+            'model_key TEXT NOT NULL, '
+            'image_hash TEXT NOT NULL, '
+            'num_detections INTEGER NOT NULL, '
+            'classes BLOB NOT NULL, '
+            'scores BLOB NOT NULL, '
+            'boxes BLOB NOT NULL, '
+            'size INTEGER NOT NULL, '
+            'accessed REAL NOT NULL, '
+            'PRIMARY KEY (model_key, image_hash))')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS outputs_accessed ON outputs (accessed)')
+
+    # Hashes of images cached for the model, to skip decoding cached images
+    def get_image_hashes(self, model_key):
+        rows = self._conn.execute(
+            'SELECT image_hash FROM outputs WHERE model_key = ?', (model_key,))
+        return {image_hash for image_hash, in rows}
+
+    def get(self, model_key, image_hash):
+        row = self._conn.execute(
+            'SELECT num_detections, classes, scores, boxes FROM outputs '
+            'WHERE model_key = ? AND image_hash = ?',
+            (model_key, image_hash)).fetchone()
+        if row is None:
+            return None
+
+        self._conn.execute(
+            'UPDATE outputs SET accessed = ? WHERE model_key = ? AND image_hash = ?',
+            (time.time(), model_key, image_hash))
+
+        num_detections, classes, scores, boxes = row
+        return {
+            'num_detections': num_detections,
+            'detection_classes': np.frombuffer(classes, dtype=np.uint8),
+            'detection_scores': np.frombuffer(scores, dtype=np.float32),
+            'detection_boxes': np.frombuffer(boxes, dtype=np.float32).reshape(-1, 4),
+        }
+
+    def put(self, model_key, image_hash, output_dict):
+        classes = output_dict['detection_classes'].astype(np.uint8).tobytes()
+        scores = output_dict['detection_scores'].astype(np.float32).tobytes()
+        boxes = output_dict['detection_boxes'].astype(np.float32).tobytes()
+        self._conn.execute(
+            'INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (model_key, image_hash, int(output_dict['num_detections']),
+             classes, scores, boxes,
+             len(classes) + len(scores) + len(boxes), time.time()))
+
+    # Remove entries not used for `max_age` seconds, then least recently
+    # used entries until the total size fits in `budget_bytes`
+    def evict(self, budget_bytes, max_age):
+        self._conn.execute(
+            'DELETE FROM outputs WHERE accessed < ?', (time.time() - max_age,))
+
+        total_size = self._conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM outputs').fetchone()[0]
+        if total_size > budget_bytes:
+            rows = self._conn.execute(
+                'SELECT accessed, size FROM outputs ORDER BY accessed').fetchall()
+            for accessed, size in rows:
+                total_size = total_size - size
+                if total_size <= budget_bytes:
+                    self._conn.execute(
+                        'DELETE FROM outputs WHERE accessed <= ?', (accessed,))
+                    break
+
+        self._conn.commit()
+
+    def commit(self):
+        self._conn.commit()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
@@ -8,7 +8,9 @@ from config import CONFIG_KEY_LABEL_MAP_PATH
 from config import CONFIG_KEY_TEST_DATA_PATH
 from config import CONFIG_KEY_RESULT_CUTOFF_THRESHOLD
 from test_worker import TestWorker
+from test_worker import WORKER_TASK_PRELOAD, WORKER_TASK_RUN, WORKER_TASK_AUTOTUNE
 from test_result import TestResult, TestResultGroup, TestResultClass
+from test_result import ColumnarTestResult
 from result_dialog import ResultDialog
 
 import sys
@@ -27,12 +29,22 @@ _PATH_INDEXED_TITLE = [
 
 _MSG_END_OF_PREDICTION = ' '
 
+# Messages when a test action is triggered while the worker is busy
+_MSG_WORKER_BUSY = {
+    WORKER_TASK_PRELOAD: 'The saved model is being loaded, Please try again after loading.',
+    WORKER_TASK_RUN: 'The test is running, Please try again after the test.',
+    WORKER_TASK_AUTOTUNE: 'Autotune is running, Please try again after autotune.',
+}
+
 UI_EVENT_SAVED_MODEL_LOAD_FAILED = 0
 UI_EVENT_SAVED_MODEL_LOAD_SUCCESS = 1
 UI_EVENT_PREDICTION_STARTED = 2
 UI_EVENT_PREDICTION_END_WITH_FAILED = 3
 UI_EVENT_PREDICTION_END_WITH_SUCCESS = 4
 UI_EVENT_PREDICTION_PROGRESS_VALUE = 5
+UI_EVENT_AUTOTUNE_STARTED = 6
+UI_EVENT_AUTOTUNE_END_WITH_FAILED = 7
+UI_EVENT_AUTOTUNE_END_WITH_SUCCESS = 8
 
 
 class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
@@ -44,11 +56,16 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         self._config.check_default()
         self._is_started = False
         self._latest_result = None
+        self._live_result = None
+        self._result_dialog = None
         self._elapsed_mills = None
 
         self._worker = TestWorker(self, config=self._config)
         self._worker.sig_result.connect(self.slot_test_result)
+        self._worker.sig_group_result.connect(self.slot_group_result)
         self._worker.sig_ui_event.connect(self.slot_ui_event)
+        self._worker.sig_log_message.connect(self.slot_log_message)
+        QtWidgets.QApplication.instance().aboutToQuit.connect(self._worker.close)
 
         self._ui_binding()
         self._ui_action_binding()
@@ -79,6 +96,8 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         self.actionOpen_Testdata_Path.triggered.connect(
             self.slot_open_test_data_path_btn)
         self.actionRun.triggered.connect(self.slot_start_btn)
+        self.actionResume.triggered.connect(self.slot_resume)
+        self.actionAutotune.triggered.connect(self.slot_autotune)
         self.actionResult.triggered.connect(self.slot_show_result_btn)
         self.actionResult.setEnabled(False)
         self.actionExit.triggered.connect(self.slot_exit)
@@ -102,10 +121,10 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             self.slot_log_message('Model: ' + self._get_current_model_path_name())
             self.slot_log_message('Threshold: {}%'.format(self._get_cutoff_threshold_value()))
             self._is_started = True
-            self.btnStartStop.setEnabled(False)
+            self._set_test_actions_enabled(False)
             self.btnShowResult.setEnabled(False)
-            self.actionRun.setEnabled(False)
             self.actionResult.setEnabled(False)
+            self._live_result = ColumnarTestResult()
             self._elapsed_mills = time.time()
         elif UI_EVENT_PREDICTION_END_WITH_FAILED == ui_event:
             self.slot_log_message("Failed to predict.")
@@ -113,8 +132,7 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
                 time.time()-self._elapsed_mills))
             self.slot_log_message(_MSG_END_OF_PREDICTION)
             self._is_started = False
-            self.btnStartStop.setEnabled(True)
-            self.actionRun.setEnabled(True)
+            self._set_test_actions_enabled(True)
             self.labelStatus.setText("Failed")
         elif UI_EVENT_PREDICTION_END_WITH_SUCCESS == ui_event:
             self.slot_log_message("Ended to predict successfully.")
@@ -122,11 +140,27 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
                 time.time()-self._elapsed_mills))
             self.slot_log_message(_MSG_END_OF_PREDICTION)
             self._is_started = False
-            self.btnStartStop.setEnabled(True)
+            self._set_test_actions_enabled(True)
             self.btnShowResult.setEnabled(True)
-            self.actionRun.setEnabled(True)
             self.actionResult.setEnabled(True)
             self.labelStatus.setText("Success")
+        elif UI_EVENT_AUTOTUNE_STARTED == ui_event:
+            self.slot_log_message('Started to autotune, It takes a few minutes.')
+            self._set_test_actions_enabled(False)
+            self.labelStatus.setText("Autotuning...")
+            self._elapsed_mills = time.time()
+        elif UI_EVENT_AUTOTUNE_END_WITH_FAILED == ui_event:
+            self.slot_log_message("Failed to autotune.")
+            self.slot_log_message("Elapsed: {:03.1f}s".format(
+                time.time()-self._elapsed_mills))
+            self._set_test_actions_enabled(True)
+            self.labelStatus.setText("Failed")
+        elif UI_EVENT_AUTOTUNE_END_WITH_SUCCESS == ui_event:
+            self.slot_log_message("Ended to autotune successfully.")
+            self.slot_log_message("Elapsed: {:03.1f}s".format(
+                time.time()-self._elapsed_mills))
+            self._set_test_actions_enabled(True)
+            self.labelStatus.setText("Success")
         else:
             raise ValueError('There is no method to handle given event')
 
@@ -137,6 +171,21 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         self.slot_log_message('Tested Count : %d' % (result.tested_count))
         self.slot_log_message('Passed Count : %d' % (result.passed_count))
         self._latest_result = result
+        self._live_result = None
+
+    # Result of a group finished while testing, It fills the result live
+    @QtCore.pyqtSlot(TestResult)
+    def slot_group_result(self, group_result):
+        if self._live_result is None:
+            return
+
+        self._live_result.extend(group_result)
+        self._latest_result = self._live_result
+        self.btnShowResult.setEnabled(True)
+        self.actionResult.setEnabled(True)
+
+        if self._result_dialog is not None:
+            self._result_dialog.add_result_groups(group_result.group)
 
     @QtCore.pyqtSlot(str)
     def slot_log_message(self, message):
@@ -144,12 +193,40 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
 
     @QtCore.pyqtSlot()
     def slot_start_btn(self):
-        if self._config.is_valid():
+        if self._check_ready_to_test():
             self._worker.start()
             self.labelStatus.setText("Processing...")
-        else:
+
+    # Resume the run interrupted by a crash or a failure
+    @QtCore.pyqtSlot()
+    def slot_resume(self):
+        if self._check_ready_to_test():
+            self._worker.resume()
+            self.labelStatus.setText("Processing...")
+
+    # Find the fastest session settings of the model on this machine
+    @QtCore.pyqtSlot()
+    def slot_autotune(self):
+        if self._check_ready_to_test():
+            self._worker.autotune()
+
+    # Whether a test action can be started, The reason is logged if not
+    def _check_ready_to_test(self):
+        task = self._worker.get_task()
+        if task is not None:
+            self.slot_log_message(_MSG_WORKER_BUSY[task])
+            return False
+        if not self._config.is_valid():
             self.slot_log_message(
-                'There is no valid configuration for testing, Plaese check configration and try again.')
+                'There is no valid configuration for testing, Please check configuration and try again.')
+            return False
+        return True
+
+    def _set_test_actions_enabled(self, enabled):
+        self.btnStartStop.setEnabled(enabled)
+        self.actionRun.setEnabled(enabled)
+        self.actionResume.setEnabled(enabled)
+        self.actionAutotune.setEnabled(enabled)
 
     @QtCore.pyqtSlot()
     def slot_show_result_btn(self):
@@ -193,6 +270,10 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         self._config.set(CONFIG_KEY_RESULT_CUTOFF_THRESHOLD, normalized_value)
         print('Threshold has changed to {}%'.format(slider_value))
 
+        # Re-score the latest result with new threshold (no inference)
+        if self._latest_result is not None and self._worker.rescore_test_result():
+            self.slot_log_message('Threshold: {}%'.format(slider_value))
+
     @QtCore.pyqtSlot()
     def slot_exit(self):
         QtWidgets.QApplication.quit()
@@ -200,7 +281,10 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
     def _showResultDialog(self):
         resultDialog = ResultDialog(self)
         resultDialog.set_test_result(self._latest_result)
+        # Keep the dialog to add groups finished while it is opened
+        self._result_dialog = resultDialog
         resultDialog.exec_()
+        self._result_dialog = None
 
     def _open_directory_select_dialog(self, path_index, old_path=None):
         if path_index == _PATH_INDEX_LABEL_MAP:
@@ -223,6 +307,9 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
 
             self._worker.set_config(self._config)
 
+            if _PATH_INDEX_SAVED_MODEL == path_index:
+                self._worker.preload_saved_model()
+
         self._update_selected_path_label(path_index)
 
     def _update_selected_path_label(self, path_index):
@@ -0,0 +1,54 @@
+import collections
+
+
+# LRU cache of loaded models with a memory budget.
+# Cached models need `close()`, which is called when they are evicted.
+class ModelCache(object):
+
+    def __init__(self, budget_bytes=2 * 1024 * 1024 * 1024):
+        self._budget_bytes = budget_bytes
+        # key -> (model, size in bytes), the last one is most recently used
+        self._entries = collections.OrderedDict()
+        self.hit_count = 0
+        self.miss_count = 0
+
+    def set_budget(self, budget_bytes):
+        self._budget_bytes = budget_bytes
+        self._evict()
+
+    def contains(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        if key not in self._entries:
+            self.miss_count = self.miss_count + 1
+            return None
+
+        self.hit_count = self.hit_count + 1
+        self._entries.move_to_end(key)
+        return self._entries[key][0]
+
+    def put(self, key, model, size):
+        if key in self._entries and self._entries[key][0] is not model:
+            self._entries[key][0].close()
+        self._entries[key] = (model, size)
+        self._entries.move_to_end(key)
+        self._evict()
+
+    def get_count(self):
+        return len(self._entries)
+
+    def get_size(self):
+        return sum(size for _, size in self._entries.values())
+
+    def clear(self):
+        for model, _ in self._entries.values():
+            model.close()
+        self._entries.clear()
+
+    # Close least recently used models until it fits in the budget,
+    # The most recently used one is kept even if it is over the budget
+    def _evict(self):
+        while len(self._entries) > 1 and self.get_size() > self._budget_bytes:
+            _, (model, _) = self._entries.popitem(last=False)
+            model.close()
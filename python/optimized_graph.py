@@ -0,0 +1,68 @@
+import os
+
+import tensorflow as tf
+from tensorflow.tools.graph_transforms import TransformGraph
+
+# File name of the optimized graph of a saved model in the cache directory
+OPTIMIZED_GRAPH_FILE_NAME = 'optimized_graph_{fingerprint}.pb'
+
+# File name of the marker of a saved model which failed to be optimized,
+# It has the error and the saved model is not optimized again
+OPTIMIZED_GRAPH_FAILED_FILE_NAME = 'optimized_graph_{fingerprint}.failed'
+
+# Graph transforms applied to the frozen graph, Constants (including
+# restored variables) are folded and nodes only for training are removed
+OPTIMIZED_GRAPH_TRANSFORMS = [
+    'remove_nodes(op=CheckNumerics)',
+    'fold_constants(ignore_errors=true)',
+    'fold_batch_norms',
+    'fold_old_batch_norms',
+    'sort_by_execution_order',
+]
+
+
+def get_optimized_graph_file_name(fingerprint):
+    return OPTIMIZED_GRAPH_FILE_NAME.format(fingerprint=fingerprint)
+
+
+def get_optimized_graph_failed_file_name(fingerprint):
+    return OPTIMIZED_GRAPH_FAILED_FILE_NAME.format(fingerprint=fingerprint)
+
+
+# Optimize the serving graph of a saved model for prediction and write it
+# to `graph_path`. Variables are frozen to constants, the graph is pruned to
+# the output tensors (`output_tensor_names` of the metadata) and constants
+# are folded. The input node is kept as it is, so the graph is imported
+# with the same input map as the saved model. The saved model is loaded
+# by a session of `session_config` (tf.ConfigProto).
+def optimize_saved_model(saved_model_path, metadata, graph_path, session_config=None):
+    input_node_name = metadata['input_type']
+    output_node_names = sorted({tensor_name.split(':')[0] for tensor_name
+                                in metadata['output_tensor_names'].values()})
+
+    graph = tf.Graph()
+    with tf.Session(graph=graph, config=session_config) as sess:
+        tf.saved_model.loader.load(sess, ["serve"], saved_model_path)
+        # Tables or other resources initialized by the init op can't be frozen
+        if graph.get_collection(tf.saved_model.constants.MAIN_OP_KEY) or \
+                graph.get_collection(tf.saved_model.constants.LEGACY_INIT_OP_KEY):
+            raise ValueError('Saved model with an init op can not be optimized')
+        graph_def = tf.graph_util.convert_variables_to_constants(
+            sess, graph.as_graph_def(), output_node_names)
+
+    graph_def = TransformGraph(graph_def, [input_node_name], output_node_names,
+                               OPTIMIZED_GRAPH_TRANSFORMS)
+
+    # Write to a temporary file of this process, Shard processes may
+    # optimize the same saved model at the same time
+    temp_path = '{}.{}.tmp'.format(graph_path, os.getpid())
+    with open(temp_path, mode='wb') as f:
+        f.write(graph_def.SerializeToString())
+    os.replace(temp_path, graph_path)
+
+
+def read_optimized_graph(graph_path):
+    graph_def = tf.GraphDef()
+    with open(graph_path, mode='rb') as f:
+        graph_def.ParseFromString(f.read())
+    return graph_def
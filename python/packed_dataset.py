@@ -0,0 +1,104 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+# File name of the packed test data in a test data directory, The test
+# data is read from it instead of group directories if it exists
+PACKED_DATASET_FILE_NAME = 'test_data.pack'
+
+# Header of packed test data, magic and (offset, size) of the index
+PACKED_DATASET_MAGIC = b'TFODPACK'
+PACKED_DATASET_HEADER = struct.Struct('<8sQQ')
+
+
+def get_packed_dataset_path(test_data_path):
+    packed_path = os.path.join(test_data_path, PACKED_DATASET_FILE_NAME)
+    if os.path.isfile(packed_path):
+        return packed_path
+    return None
+
+
+# Pack a test data directory (group directories of jpeg images and
+# `classes.json`) into one file. Images are stored back to back in order of
+# group and image name and followed by a JSON index of
+# {group name: {'classes', 'images': [[name, offset, size, sha256], ...]}}
+def pack_test_dataset(test_data_path, packed_path):
+    with os.scandir(test_data_path) as entries:
+        group_names = sorted(entry.name for entry in entries if entry.is_dir())
+
+    index = dict()
+    with open(packed_path, mode='wb') as out:
+        out.write(PACKED_DATASET_HEADER.pack(PACKED_DATASET_MAGIC, 0, 0))
+        for group_name in group_names:
+            group_path = os.path.join(test_data_path, group_name)
+            with os.scandir(group_path) as entries:
+                image_file_list = sorted(entry.name for entry in entries
+                                         if entry.name.lower().endswith('.jpg'))
+            if len(image_file_list) == 0:
+                continue
+
+            with open(os.path.join(group_path, 'classes.json'), mode='r', encoding='utf-8') as f:
+                classes = json.load(f)['classes']
+
+            images = []
+            for image_file in image_file_list:
+                with open(os.path.join(group_path, image_file), mode='rb') as f:
+                    image_bytes = f.read()
+                images.append([image_file, out.tell(), len(image_bytes),
+                               hashlib.sha256(image_bytes).hexdigest()])
+                out.write(image_bytes)
+
+            index[group_name] = {'classes': classes, 'images': images}
+
+        index_offset = out.tell()
+        index_bytes = json.dumps(index).encode('utf-8')
+        out.write(index_bytes)
+        out.seek(0)
+        out.write(PACKED_DATASET_HEADER.pack(
+            PACKED_DATASET_MAGIC, index_offset, len(index_bytes)))
+
+    return index
+
+
+# Reader of packed test data, Images are read from a memory map of the file
+# as memoryviews (no copy). The file is unmapped when this object is
+# deleted and no memoryview of it is left.
+class PackedDataset(object):
+
+    def __init__(self, packed_path):
+        self.path = packed_path
+        stat = os.stat(packed_path)
+        self.snapshot = '{}:{}:{}'.format(
+            os.path.abspath(packed_path), stat.st_size, stat.st_mtime_ns)
+
+        with open(packed_path, mode='rb') as f:
+            magic, index_offset, index_size = PACKED_DATASET_HEADER.unpack(
+                f.read(PACKED_DATASET_HEADER.size))
+            if magic != PACKED_DATASET_MAGIC:
+                raise ValueError('It is not a packed test data: ' + packed_path)
+            f.seek(index_offset)
+            self._index = json.loads(f.read(index_size).decode('utf-8'))
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # Images are read in order of the file
+        if hasattr(self._mmap, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+
+        self._locations = {
+            (group_name, image_file): (offset, size)
+            for group_name, group in self._index.items()
+            for image_file, offset, size, _ in group['images']}
+
+    # Returns {group name: {'test_data', 'classes', 'image_hashes'}}
+    def get_test_groups(self):
+        return {group_name: {
+            'test_data': [image[0] for image in group['images']],
+            'classes': list(group['classes']),
+            'image_hashes': [image[3] for image in group['images']],
+        } for group_name, group in sorted(self._index.items())}
+
+    def get_image(self, group_name, image_file):
+        offset, size = self._locations[(group_name, image_file)]
+        return memoryview(self._mmap)[offset:offset + size]
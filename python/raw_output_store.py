@@ -0,0 +1,123 @@
+import numpy as np
+
+from detection_postprocess import get_cutoff_counts
+
+# Number of appended images which are packed into a chunk at once
+CHUNK_IMAGE_COUNT = 256
+
+
+# Raw (not filtered by threshold) detection outputs of images.
+# Outputs of all images are kept in contiguous arrays and the detections
+# of an image are located by its offsets, so any threshold can be applied
+# later without running inference again. Only detections of appended
+# images are copied (no masks, no views of batch outputs) and they are
+# packed into chunks while the run goes on.
+class RawOutputStore(object):
+
+    def __init__(self):
+        # Copied (counts, classes, scores, boxes) of images not in a chunk
+        self._pending = []
+        # Packed (counts, classes, scores, boxes) of CHUNK_IMAGE_COUNT images
+        self._chunks = []
+        self._chunk_image_count = 0
+        self._classes = np.zeros((0,), dtype=np.uint8)
+        self._scores = np.zeros((0,), dtype=np.float32)
+        self._boxes = np.zeros((0, 4), dtype=np.float32)
+        # Detections of image i are in [offsets[i], offsets[i+1])
+        self._offsets = np.zeros((1,), dtype=np.int64)
+        # Cutoff counts of all images for the latest threshold
+        self._cutoff_thres = None
+        self._cutoff_counts = None
+
+    # Append outputs of an image (a result of TestSession)
+    def append(self, output_dict):
+        count = int(output_dict['num_detections'])
+        self._pending.append((
+            count,
+            np.array(output_dict['detection_classes'][:count], dtype=np.uint8),
+            np.array(output_dict['detection_scores'][:count], dtype=np.float32),
+            np.array(output_dict['detection_boxes'][:count],
+                     dtype=np.float32).reshape(-1, 4)))
+        if len(self._pending) >= CHUNK_IMAGE_COUNT:
+            self._pack_pending()
+
+    def get_count(self):
+        return len(self._offsets) - 1 + self._chunk_image_count + len(self._pending)
+
+    # Number of detections passing the threshold of all images
+    def get_cutoff_counts(self, thres=0.5):
+        self._compact()
+        if self._cutoff_thres != thres:
+            self._cutoff_counts = get_cutoff_counts(
+                self._scores, self._offsets, thres)
+            self._cutoff_thres = thres
+        return self._cutoff_counts
+
+    # Get (image index, classes, scores, boxes) of detections passing the
+    # threshold in all images
+    def get_filtered_arrays(self, thres=0.5):
+        cutoff_counts = self.get_cutoff_counts(thres)
+        detection_counts = np.diff(self._offsets)
+        image_index = np.repeat(
+            np.arange(len(detection_counts)), detection_counts)
+        # Rank of each detection in its image
+        rank = np.arange(len(self._scores)) - self._offsets[:-1][image_index]
+        passed = rank < cutoff_counts[image_index]
+
+        return (image_index[passed], self._classes[passed],
+                self._scores[passed], self._boxes[passed])
+
+    # Get outputs of an image filtered by threshold
+    # (the scores are sorted in descending order by the model)
+    def get(self, index, thres=0.5):
+        cutoff_counts = self.get_cutoff_counts(thres)
+        start = self._offsets[index]
+        end = start + cutoff_counts[index]
+
+        return {
+            'num_detections': int(end - start),
+            'detection_classes': self._classes[start:end],
+            'detection_boxes': self._boxes[start:end],
+            'detection_scores': self._scores[start:end],
+        }
+
+    # (detection counts, classes, scores, boxes) of all images
+    def get_arrays(self):
+        self._compact()
+        return np.diff(self._offsets), self._classes, self._scores, self._boxes
+
+    # Outputs are kept in memory, Nothing to release
+    def release(self):
+        pass
+
+    # Pack pending images into a chunk
+    def _pack_pending(self):
+        if len(self._pending) == 0:
+            return
+
+        self._chunks.append((
+            np.array([count for count, _, _, _ in self._pending], dtype=np.int64),
+            np.concatenate([classes for _, classes, _, _ in self._pending]),
+            np.concatenate([scores for _, _, scores, _ in self._pending]),
+            np.concatenate([boxes for _, _, _, boxes in self._pending])))
+        self._chunk_image_count = self._chunk_image_count + len(self._pending)
+        self._pending = []
+
+    # Move chunks to the contiguous arrays
+    def _compact(self):
+        self._pack_pending()
+        if len(self._chunks) == 0:
+            return
+
+        counts = np.concatenate([counts for counts, _, _, _ in self._chunks])
+        self._classes = np.concatenate(
+            [self._classes] + [classes for _, classes, _, _ in self._chunks])
+        self._scores = np.concatenate(
+            [self._scores] + [scores for _, _, scores, _ in self._chunks])
+        self._boxes = np.concatenate(
+            [self._boxes] + [boxes for _, _, _, boxes in self._chunks])
+        self._offsets = np.concatenate(
+            [self._offsets, self._offsets[-1] + np.cumsum(counts, dtype=np.int64)])
+        self._chunks = []
+        self._chunk_image_count = 0
+        self._cutoff_thres = None
@@ -1,10 +1,16 @@
 
+import collections
+
 from PyQt5 import QtCore
 from PyQt5 import QtWidgets
 from PyQt5 import QtGui
 from ui_result_dialog import Ui_Dialog
 from result_image_item import ResultImageItem
 
+# Images of groups added to the list at a time, Images of next groups are
+# added (built, for a spilled result) when the list is scrolled to the end
+RESULT_PAGE_IMAGE_COUNT = 200
+
 
 class ResultDialog(QtWidgets.QDialog, Ui_Dialog):
     _test_result = None
@@ -12,22 +18,63 @@ class ResultDialog(QtWidgets.QDialog, Ui_Dialog):
     def __init__(self, parent=None):
         super(QtWidgets.QDialog, self).__init__()
         self.setupUi(self)
+        self._result_image_index = 0
+        self._mark_group = True
+        # Groups which are not added to the list yet
+        self._pending_groups = collections.deque()
+        self.widgetResultList.verticalScrollBar().valueChanged.connect(
+            self.slot_result_list_scrolled)
 
     def set_test_result(self, test_result):
         self._test_result = test_result
         self._build_table_by_result()
 
+    # Add groups finished after the test result was set (streaming mode),
+    # The test result has been updated with the groups already
+    def add_result_groups(self, result_groups):
+        self._update_count_labels()
+        self._pending_groups.extend(result_groups)
+        self._add_next_page_at_end()
+
+    @QtCore.pyqtSlot(int)
+    def slot_result_list_scrolled(self, value):
+        self._add_next_page_at_end()
+
     def _build_table_by_result(self):
+        self._update_count_labels()
+        self._pending_groups.extend(self._test_result.group)
+        self._add_next_page_at_end()
+
+    # Add next groups of RESULT_PAGE_IMAGE_COUNT images if the end of the
+    # list is shown
+    def _add_next_page_at_end(self):
+        scroll_bar = self.widgetResultList.verticalScrollBar()
+        if scroll_bar.value() < scroll_bar.maximum():
+            return
+
+        result_groups = []
+        image_count = 0
+        while len(self._pending_groups) > 0 and image_count < RESULT_PAGE_IMAGE_COUNT:
+            result_group = self._pending_groups.popleft()
+            # Images of a spilled group are built here
+            images = result_group.images
+            result_groups.append((result_group, images))
+            image_count = image_count + len(images)
+
+        self._add_result_groups(result_groups)
+
+    def _update_count_labels(self):
         self.labelTestedCount.setText(str(self._test_result.tested_count))
         self.labelPassedCount.setText(str(self._test_result.passed_count))
 
-        mark_group = True
+    def _add_result_groups(self, result_groups):
+        mark_group = self._mark_group
         color_group = QtGui.QColor(0, 0, 0, alpha=20)
 
-        result_image_index = 0
-        for result_group in self._test_result.group:
+        result_image_index = self._result_image_index
+        for result_group, images in result_groups:
             #set_of_required_classes = set(result_group.required_classes)
-            for result_image in result_group.images:
+            for result_image in images:
                 result_image.group_name = result_group.name
                 result_image_item = ResultImageItem(
                     result_image=result_image, required_classes=result_group.required_classes)
@@ -47,3 +94,6 @@ class ResultDialog(QtWidgets.QDialog, Ui_Dialog):
                     list_widget_item, result_image_item)
 
             mark_group = not mark_group
+
+        self._mark_group = mark_group
+        self._result_image_index = result_image_index
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from spilled_output_store import DETECTION_RECORD_DTYPE
+
+
+# Identity of the test data of a run, Changed by adding, removing or
+# modifying any image (by relative path, size and modification time).
+# [size, mtime_ns] of the items are reused if they are given (scanned with
+# the test data), or images are stat-ed by `worker_count` threads
+def get_dataset_snapshot(data_path, test_items, image_stats=None, worker_count=8):
+    if image_stats is None:
+        with ThreadPoolExecutor(max_workers=max(1, worker_count)) as executor:
+            image_stats = list(executor.map(
+                lambda test_item: _get_image_stat(data_path, *test_item), test_items))
+
+    snapshot = hashlib.sha1()
+    for (group_name, image_file), (size, mtime_ns) in zip(test_items, image_stats):
+        snapshot.update('{}/{}:{}:{}\n'.format(
+            group_name, image_file, size, mtime_ns).encode('utf-8'))
+    return snapshot.hexdigest()
+
+
+def _get_image_stat(data_path, group_name, image_file):
+    stat = os.stat(os.path.join(data_path, group_name, image_file))
+    return stat.st_size, stat.st_mtime_ns
+
+
+# Append-only journal of images finished in a run. `<path>` has a JSON
+# header line of the model fingerprint and the dataset snapshot and then a
+# JSON line of (group name, image file) of each image. Raw detections of
+# images are fixed size binary records in `<path>.det` and the detection
+# count of each image is in `<path>.cnt` (same as DetectionSegment).
+# Records are in the order of test items, so a journal of an interrupted
+# run is the prefix of the items which don't need inference. Images broken
+# by a crash (in any of the files) are dropped when the journal is resumed.
+class RunJournal(object):
+
+    def __init__(self, path):
+        self._path = path
+        self._file = None
+        self._detection_file = None
+        self._count_file = None
+
+    # Start a new journal, The previous journal is discarded
+    def start(self, fingerprint, snapshot):
+        self.close()
+        self._file = open(self._path, mode='wb')
+        self._detection_file = open(self._path + '.det', mode='wb')
+        self._count_file = open(self._path + '.cnt', mode='wb')
+        self._write_line({'fingerprint': fingerprint, 'snapshot': snapshot})
+        self.flush()
+
+    # Returns records of (group name, image file, output dict) journaled
+    # with same fingerprint and snapshot and continues the journal after
+    # them. A new journal is started if there is nothing to resume.
+    def resume(self, fingerprint, snapshot):
+        self.close()
+        items = []
+        # Size of the header and the lines of each image
+        line_sizes = []
+        try:
+            with open(self._path, mode='rb') as f:
+                header = json.loads(f.readline().decode('utf-8'))
+                if header.get('fingerprint') != fingerprint or \
+                        header.get('snapshot') != snapshot:
+                    raise ValueError('The journal is of other model or dataset')
+                line_sizes.append(f.tell())
+
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        item = json.loads(line.decode('utf-8'))
+                        items.append((item['group'], item['image']))
+                    except (ValueError, KeyError):
+                        break
+                    line_sizes.append(len(line))
+
+            counts = np.fromfile(self._path + '.cnt', dtype=np.int64)
+            detection_count = os.path.getsize(
+                self._path + '.det') // DETECTION_RECORD_DTYPE.itemsize
+        except (OSError, ValueError):
+            self.start(fingerprint, snapshot)
+            return []
+
+        # Images of which all files are written
+        offsets = np.concatenate([np.zeros((1,), dtype=np.int64),
+                                  np.cumsum(counts[:len(items)], dtype=np.int64)])
+        image_count = int(np.searchsorted(offsets, detection_count, side='right')) - 1
+        detections = np.fromfile(self._path + '.det', dtype=DETECTION_RECORD_DTYPE,
+                                 count=int(offsets[image_count]))
+
+        records = []
+        for index, (group_name, image_file) in enumerate(items[:image_count]):
+            image_detections = detections[offsets[index]:offsets[index + 1]]
+            records.append((group_name, image_file, {
+                'num_detections': int(counts[index]),
+                'detection_classes': image_detections['label'],
+                'detection_scores': image_detections['score'],
+                'detection_boxes': image_detections['box'],
+            }))
+
+        self._file = self._open_at(self._path, sum(line_sizes[:image_count + 1]))
+        self._detection_file = self._open_at(
+            self._path + '.det', int(offsets[image_count]) * DETECTION_RECORD_DTYPE.itemsize)
+        self._count_file = self._open_at(self._path + '.cnt', image_count * 8)
+        return records
+
+    def append(self, group_name, image_file, output_dict):
+        count = int(output_dict['num_detections'])
+        detections = np.empty((count,), dtype=DETECTION_RECORD_DTYPE)
+        detections['label'] = output_dict['detection_classes'][:count]
+        detections['score'] = output_dict['detection_scores'][:count]
+        detections['box'] = output_dict['detection_boxes'][:count]
+        detections.tofile(self._detection_file)
+        np.array([count], dtype=np.int64).tofile(self._count_file)
+        self._write_line({'group': group_name, 'image': image_file})
+
+    # Records are kept by the OS even if this process dies after flush
+    def flush(self):
+        for f in [self._detection_file, self._count_file, self._file]:
+            if f is not None:
+                f.flush()
+
+    def close(self):
+        for f in [self._file, self._detection_file, self._count_file]:
+            if f is not None:
+                f.close()
+        self._file = None
+        self._detection_file = None
+        self._count_file = None
+
+    def _write_line(self, value):
+        self._file.write(json.dumps(value).encode('utf-8') + b'\n')
+
+    # Open a file to continue writing after `size` bytes
+    def _open_at(self, path, size):
+        f = open(path, mode='r+b')
+        f.truncate(size)
+        f.seek(size)
+        return f
@@ -0,0 +1,32 @@
+import hashlib
+import os
+
+
+# Fingerprint of a saved model directory from the name, size and mtime of
+# its files. It changes whenever the export is rewritten, without reading
+# the (possibly large) graph and variables.
+def get_saved_model_fingerprint(saved_model_path):
+    fingerprint = hashlib.sha1()
+    for root, dirs, files in os.walk(saved_model_path):
+        dirs.sort()
+        for file_name in sorted(files):
+            file_path = os.path.join(root, file_name)
+            file_stat = os.stat(file_path)
+            fingerprint.update('{}:{}:{};'.format(
+                os.path.relpath(file_path, saved_model_path),
+                file_stat.st_size,
+                file_stat.st_mtime_ns).encode('utf-8'))
+
+    return fingerprint.hexdigest()
+
+
+# Size of files in a saved model directory, used as an estimate of memory
+# which the loaded model takes
+def get_saved_model_size(saved_model_path):
+    total_size = 0
+    for root, _, files in os.walk(saved_model_path):
+        for file_name in files:
+            total_size = total_size + \
+                os.path.getsize(os.path.join(root, file_name))
+
+    return total_size
@@ -0,0 +1,134 @@
+import json
+import os
+
+# Keys of TF session settings (same as fields of tf.ConfigProto)
+SESSION_SETTING_INTRA_OP_THREADS = 'intra_op_parallelism_threads'
+SESSION_SETTING_INTER_OP_THREADS = 'inter_op_parallelism_threads'
+SESSION_SETTING_GRAPH_OPTIMIZER_LEVEL = 'graph_optimizer_level'
+SESSION_SETTING_XLA_JIT = 'xla_jit'
+SESSION_SETTING_USE_PER_SESSION_THREADS = 'use_per_session_threads'
+
+# Graph optimizer levels (tf.OptimizerOptions.L0 and L1)
+GRAPH_OPTIMIZER_LEVEL_L0 = 'L0'
+GRAPH_OPTIMIZER_LEVEL_L1 = 'L1'
+
+# Keys of run settings of group prediction
+RUN_SETTING_BATCH_SIZE = 'batch_size'
+RUN_SETTING_CONCURRENT_RUNS = 'concurrent_runs'
+
+# File names of tuned settings by model fingerprint in the cache directory
+SESSION_TUNING_FILE_NAME = 'session_tuning.json'
+RUN_TUNING_FILE_NAME = 'run_tuning.json'
+
+# Minimum gain of images/sec to try the next larger value of a run setting,
+# A smaller gain is the knee of the throughput curve
+KNEE_MIN_GAIN = 0.05
+
+
+# Values to try for each setting, Settings are tuned one at a time in this
+# order with the best values found so far (0 threads is the TF default)
+def get_session_setting_axes(cpu_count=None):
+    cpu_count = cpu_count or os.cpu_count() or 1
+    return [
+        (SESSION_SETTING_INTRA_OP_THREADS,
+         sorted({0, cpu_count, max(1, cpu_count // 2)})),
+        (SESSION_SETTING_INTER_OP_THREADS, [0, 1, 2]),
+        (SESSION_SETTING_GRAPH_OPTIMIZER_LEVEL,
+         [GRAPH_OPTIMIZER_LEVEL_L1, GRAPH_OPTIMIZER_LEVEL_L0]),
+        (SESSION_SETTING_XLA_JIT, [False, True]),
+    ]
+
+
+# Tune settings by coordinate search, `measure(settings)` returns
+# images/sec with the settings. Returns (best settings, images/sec)
+def tune_settings(measure, base_settings, axes):
+    best_settings = dict(base_settings)
+    best_throughput = measure(best_settings)
+    for key, values in axes:
+        for value in values:
+            if value == best_settings.get(key):
+                continue
+            settings = dict(best_settings)
+            settings[key] = value
+            throughput = measure(settings)
+            if throughput > best_throughput:
+                best_settings = settings
+                best_throughput = throughput
+
+    return best_settings, best_throughput
+
+
+# Values of (intra op threads, concurrent runs, batch sizes) to try,
+# in ascending order
+def get_run_setting_axes(cpu_count=None):
+    cpu_count = cpu_count or os.cpu_count() or 1
+    thread_counts = sorted({max(1, cpu_count // 4), max(1, cpu_count // 2), cpu_count})
+    concurrent_runs = [runs for runs in [1, 2, 4, 8] if runs <= max(1, cpu_count // 2)]
+    batch_sizes = [1, 2, 4, 8, 16, 32]
+    return thread_counts, concurrent_runs, batch_sizes
+
+
+# Measure ascending values until the gain of images/sec gets below
+# KNEE_MIN_GAIN, Returns (value at the knee, images/sec)
+def find_knee(measure, values):
+    knee_value = None
+    knee_throughput = 0.0
+    for value in values:
+        throughput = measure(value)
+        if knee_value is not None and \
+                throughput < knee_throughput * (1 + KNEE_MIN_GAIN):
+            break
+        knee_value = value
+        knee_throughput = throughput
+
+    return knee_value, knee_throughput
+
+
+# Sweep batch size x concurrent runs x intra op threads, Batch size and
+# concurrent runs are increased up to their knee for each thread count.
+# `measure(thread_count, concurrent_runs, batch_size)` returns images/sec.
+# Returns (best run settings with intra op threads, images/sec)
+def tune_run_settings(measure, thread_counts, concurrent_runs, batch_sizes):
+    best_settings = None
+    best_throughput = 0.0
+    for thread_count in thread_counts:
+        batch_size_by_runs = dict()
+
+        def measure_runs(runs):
+            batch_size, throughput = find_knee(
+                lambda batch_size: measure(thread_count, runs, batch_size), batch_sizes)
+            batch_size_by_runs[runs] = batch_size
+            return throughput
+
+        runs, throughput = find_knee(measure_runs, concurrent_runs)
+        if best_settings is None or throughput > best_throughput:
+            best_settings = {
+                SESSION_SETTING_INTRA_OP_THREADS: thread_count,
+                RUN_SETTING_CONCURRENT_RUNS: runs,
+                RUN_SETTING_BATCH_SIZE: batch_size_by_runs[runs],
+            }
+            best_throughput = throughput
+
+    return best_settings, best_throughput
+
+
+# Tuned settings by model fingerprint, kept in a JSON file
+class TuningStore(object):
+
+    def __init__(self, path):
+        self._path = path
+        self._entries = dict()
+        try:
+            with open(path, mode='r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def get(self, fingerprint):
+        return self._entries.get(fingerprint)
+
+    def put(self, fingerprint, settings):
+        self._entries[fingerprint] = settings
+        with open(self._path + '.tmp', mode='w', encoding='utf-8') as f:
+            json.dump(self._entries, f)
+        os.replace(self._path + '.tmp', self._path)
@@ -0,0 +1,154 @@
+import multiprocessing
+import os
+import queue
+
+from config import Config
+from config import CONFIG_KEY_STREAM_GROUP_RESULTS
+from config import CONFIG_KEY_BOUNDED_MEMORY
+from config import CONFIG_KEY_RUN_JOURNAL_ENABLED
+from config import CONFIG_KEY_INFERENCE_CACHE_ENABLED
+from test_session import TestSession
+import test_session
+
+# Messages from shard processes to the parent
+SHARD_MESSAGE_COUNT = 'count'
+SHARD_MESSAGE_GROUP_RESULT = 'group_result'
+SHARD_MESSAGE_SUCCESS = 'success'
+SHARD_MESSAGE_FAILED = 'failed'
+
+# Seconds to wait a message before checking shard processes are alive
+SHARD_POLL_SECONDS = 1
+
+# Config of a shard process, Each group is sent to the parent as soon as
+# it is finished and files in the cache directory are not shared between
+# processes (journal, inference cache and spilled outputs)
+SHARD_CONFIG_OVERRIDES = {
+    CONFIG_KEY_STREAM_GROUP_RESULTS: True,
+    CONFIG_KEY_BOUNDED_MEMORY: False,
+    CONFIG_KEY_RUN_JOURNAL_ENABLED: False,
+    CONFIG_KEY_INFERENCE_CACHE_ENABLED: False,
+}
+
+
+class _ShardConfig(Config):
+
+    def get(self, key, get_type=str):
+        if key in SHARD_CONFIG_OVERRIDES:
+            return SHARD_CONFIG_OVERRIDES[key]
+        return super().get(key, get_type=get_type)
+
+
+# Split groups to shards of similar image count (largest group first),
+# Results and image stats (for the journal, disabled in shards) are not sent
+def split_test_groups(test_groups, shard_count):
+    shards = [dict() for _ in range(shard_count)]
+    image_counts = [0] * shard_count
+    for group_name, group_data in sorted(
+            test_groups.items(), key=lambda item: -len(item[1]['test_data'])):
+        shard_index = image_counts.index(min(image_counts))
+        shards[shard_index][group_name] = {
+            key: value for key, value in group_data.items()
+            if key not in ['results', 'image_stats']}
+        image_counts[shard_index] = image_counts[shard_index] + \
+            len(group_data['test_data'])
+
+    return [shard for shard in shards if len(shard) > 0]
+
+
+# Entry of a shard process, Loads the saved model once with limited threads
+# and predicts its groups. Signals of the session are called directly
+# (same thread) and forwarded to the parent through the queue
+def _run_shard(shard_index, saved_model_path, data_path, test_groups,
+               use_dataset_pipeline, intra_op_threads, message_queue):
+    session = TestSession(config=_ShardConfig())
+    session.set_thread_limit(intra_op_threads, 1)
+
+    def on_status(status):
+        if status in [test_session.SESSION_STATUS_LOAD_FAILED,
+                      test_session.SESSION_STATUS_PREDICTION_FAILED]:
+            message_queue.put((SHARD_MESSAGE_FAILED, shard_index))
+        elif status == test_session.SESSION_STATUS_PREDICTION_SUCCESS:
+            message_queue.put((SHARD_MESSAGE_SUCCESS, shard_index))
+
+    def on_result(ret_dict):
+        for group_name, raw_outputs in ret_dict.items():
+            message_queue.put(
+                (SHARD_MESSAGE_GROUP_RESULT, group_name, raw_outputs))
+
+    session.sigTestSessionStatus.connect(on_status)
+    session.sigTestSessionCount.connect(
+        lambda count, _: message_queue.put((SHARD_MESSAGE_COUNT, shard_index, count)))
+    session.sigTestSessionGroupResult.connect(
+        lambda group_name, raw_outputs: message_queue.put(
+            (SHARD_MESSAGE_GROUP_RESULT, group_name, raw_outputs)))
+    session.sigTestSessionResult.connect(on_result)
+
+    session.loadSavedModel(saved_model_path)
+    if session.get_fingerprint() is None:
+        return
+
+    if use_dataset_pipeline:
+        session.slot_predict_group_dataset(data_path, test_groups)
+    else:
+        session.slot_predict_group(data_path, test_groups)
+
+
+# Run test groups split to processes, Each process has its own session so
+# python work (decode, post-processing) runs in parallel without the GIL.
+# Progress of all shards is summed and raw outputs of each group are
+# passed to `on_group_result(group name, RawOutputStore)` when it's finished
+class ShardedRunner(object):
+
+    def __init__(self, shard_count, intra_op_threads=None):
+        self._shard_count = max(1, shard_count)
+        if intra_op_threads is None or intra_op_threads <= 0:
+            intra_op_threads = max(1, (os.cpu_count() or 1) // self._shard_count)
+        self._intra_op_threads = intra_op_threads
+
+    # Returns True if all shards are finished successfully
+    def run(self, saved_model_path, data_path, test_groups,
+            on_count, on_group_result, use_dataset_pipeline=False):
+        shards = split_test_groups(test_groups, self._shard_count)
+        total_image_count = sum(len(group_data['test_data'])
+                                for group_data in test_groups.values())
+
+        # Spawn (not fork) processes, TF and Qt of the parent can't be forked
+        context = multiprocessing.get_context('spawn')
+        message_queue = context.Queue()
+        processes = [context.Process(
+            target=_run_shard,
+            args=(shard_index, saved_model_path, data_path, shard,
+                  use_dataset_pipeline, self._intra_op_threads, message_queue),
+            daemon=True) for shard_index, shard in enumerate(shards)]
+        for process in processes:
+            process.start()
+
+        shard_counts = [0] * len(shards)
+        finished = set()
+        try:
+            while len(finished) < len(shards):
+                try:
+                    message = message_queue.get(timeout=SHARD_POLL_SECONDS)
+                except queue.Empty:
+                    # A process which died without a message (crashed)
+                    if any(not process.is_alive() and shard_index not in finished
+                           for shard_index, process in enumerate(processes)):
+                        return False
+                    continue
+
+                if message[0] == SHARD_MESSAGE_COUNT:
+                    shard_counts[message[1]] = message[2]
+                    on_count(sum(shard_counts), total_image_count)
+                elif message[0] == SHARD_MESSAGE_GROUP_RESULT:
+                    on_group_result(message[1], message[2])
+                elif message[0] == SHARD_MESSAGE_SUCCESS:
+                    finished.add(message[1])
+                else:
+                    return False
+
+            return True
+        finally:
+            for process in processes:
+                if len(finished) < len(shards):
+                    process.terminate()
+                process.join()
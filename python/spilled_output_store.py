@@ -0,0 +1,130 @@
+import os
+
+import numpy as np
+
+from raw_output_store import RawOutputStore
+
+# A detection record in the segment file
+DETECTION_RECORD_DTYPE = np.dtype([
+    ('label', np.uint8),
+    ('score', np.float32),
+    ('box', np.float32, (4,)),
+])
+
+
+# Append-only files of raw detection outputs of a run.
+# `<path>.det` has detection records and `<path>.cnt` has the detection
+# count of each image, in the order of appended images.
+class DetectionSegment(object):
+
+    def __init__(self, path):
+        self._path = path
+        self._detection_file = open(path + '.det', mode='wb')
+        self._count_file = open(path + '.cnt', mode='wb')
+        self.image_count = 0
+        self.detection_count = 0
+
+    def append(self, output_dict):
+        count = int(output_dict['num_detections'])
+        self.append_arrays(np.array([count], dtype=np.int64),
+                           output_dict['detection_classes'][:count],
+                           output_dict['detection_scores'][:count],
+                           output_dict['detection_boxes'][:count])
+
+    # Append outputs of images at once, Detections of the images are
+    # concatenated in the arrays in order of `counts`
+    def append_arrays(self, counts, classes, scores, boxes):
+        records = np.empty((len(scores),), dtype=DETECTION_RECORD_DTYPE)
+        records['label'] = classes
+        records['score'] = scores
+        records['box'] = np.reshape(boxes, (-1, 4))
+        records.tofile(self._detection_file)
+        np.asarray(counts, dtype=np.int64).tofile(self._count_file)
+
+        self.image_count = self.image_count + len(counts)
+        self.detection_count = self.detection_count + len(scores)
+
+    # Memory mapped records and detection offsets of images in
+    # [image_start, image_end), Records of them start at detection_start
+    def read(self, image_start, image_end, detection_start):
+        self._detection_file.flush()
+        self._count_file.flush()
+
+        counts = np.zeros((0,), dtype=np.int64)
+        if image_end > image_start:
+            counts = np.memmap(self._path + '.cnt', dtype=np.int64, mode='r',
+                               offset=image_start * 8,
+                               shape=(image_end - image_start,))
+        offsets = np.concatenate(
+            [np.zeros((1,), dtype=np.int64), np.cumsum(counts, dtype=np.int64)])
+
+        records = np.zeros((0,), dtype=DETECTION_RECORD_DTYPE)
+        if offsets[-1] > 0:
+            records = np.memmap(self._path + '.det', dtype=DETECTION_RECORD_DTYPE, mode='r',
+                                offset=detection_start * DETECTION_RECORD_DTYPE.itemsize,
+                                shape=(int(offsets[-1]),))
+
+        return records, offsets
+
+    def close(self):
+        self._detection_file.close()
+        self._count_file.close()
+
+    # Remove the files, Arrays mapped already are still valid on POSIX
+    def remove(self):
+        self.close()
+        for extension in ['.det', '.cnt']:
+            if os.path.exists(self._path + extension):
+                os.remove(self._path + extension)
+
+
+# RawOutputStore of a group which spills outputs to a DetectionSegment.
+# Nothing of each image is kept in memory, the arrays are memory mapped
+# from the segment when they are read and dropped by release().
+# Images of a group must be appended contiguously in the segment.
+class SpilledOutputStore(RawOutputStore):
+
+    def __init__(self, segment):
+        super().__init__()
+        self._segment = segment
+        self._image_start = None
+        self._detection_start = None
+        self._count = 0
+        self._mapped_count = 0
+
+    def append(self, output_dict):
+        self._start()
+        self._segment.append(output_dict)
+        self._count = self._count + 1
+
+    # Append all images of a RawOutputStore (ex: received from a shard)
+    def extend(self, raw_outputs):
+        self._start()
+        counts, classes, scores, boxes = raw_outputs.get_arrays()
+        self._segment.append_arrays(counts, classes, scores, boxes)
+        self._count = self._count + len(counts)
+
+    def _start(self):
+        if self._image_start is None:
+            self._image_start = self._segment.image_count
+            self._detection_start = self._segment.detection_count
+
+    def get_count(self):
+        return self._count
+
+    # Drop mapped arrays, They are mapped again when it is read
+    def release(self):
+        super().__init__()
+        self._mapped_count = 0
+
+    def _compact(self):
+        if self._mapped_count == self._count:
+            return
+
+        records, self._offsets = self._segment.read(
+            self._image_start, self._image_start + self._count, self._detection_start)
+        self._classes = records['label']
+        self._scores = records['score']
+        self._boxes = records['box']
+        self._mapped_count = self._count
+        self._cutoff_thres = None
@@ -1,3 +1,4 @@
+import numpy as np
 
 
 # Containing whole result of prediction
@@ -43,3 +44,211 @@ class TestResult(object):
 
     def is_passed(self):
         return self.passed_count != 0 and (self.passed_count == self.tested_count)
+
+
+# Columnar result of prediction, Detections of all images are kept in
+# contiguous arrays instead of an object per detection.
+# `group` gives lightweight views which are used like TestResultGroup.
+class ColumnarTestResult(TestResult):
+
+    def __init__(self):
+        self.passed_count = 0
+        self.tested_count = 0
+        # Per detection, sorted by image and then by label
+        self.image_index = np.zeros((0,), dtype=np.int64)
+        self.label = np.zeros((0,), dtype=np.int32)
+        self.score = np.zeros((0,), dtype=np.float32)
+        self.box = np.zeros((0, 4), dtype=np.float32)
+        # Detections of image i are in [class_offsets[i], class_offsets[i+1])
+        self.class_offsets = np.zeros((1,), dtype=np.int64)
+        # Images of group g are in [image_offsets[g], image_offsets[g+1])
+        self.image_offsets = np.zeros((1,), dtype=np.int64)
+        self.image_passed = np.zeros((0,), dtype=bool)
+        self.image_names = list()
+        self.image_filepaths = list()
+        self.group_names = list()
+        self.group_required_classes = list()
+        # Class name by label
+        self.label_names = dict()
+        self._pending = list()
+
+    # Append a group, `image_index` is the index of image in this group
+    def append_group(self, name, required_classes, image_names, image_filepaths,
+                     image_index, label, score, box, image_passed):
+        self.group_names.append(name)
+        self.group_required_classes.append(required_classes)
+        self.image_names.extend(image_names)
+        self.image_filepaths.extend(image_filepaths)
+        self.passed_count = self.passed_count + int(np.count_nonzero(image_passed))
+        self.tested_count = self.tested_count + len(image_names)
+
+        # Sort classes in each image by label
+        order = np.lexsort((label, image_index))
+        self._pending.append((image_index[order], label[order],
+                              score[order], box[order], image_passed))
+
+    # Append all groups of other columnar result
+    def extend(self, other):
+        other._compact()
+        self.label_names.update(other.label_names)
+        for index in range(len(other.group_names)):
+            image_start = other.image_offsets[index]
+            image_end = other.image_offsets[index + 1]
+            class_start = other.class_offsets[image_start]
+            class_end = other.class_offsets[image_end]
+            self.append_group(
+                other.group_names[index],
+                other.group_required_classes[index],
+                other.image_names[image_start:image_end],
+                other.image_filepaths[image_start:image_end],
+                other.image_index[class_start:class_end] - image_start,
+                other.label[class_start:class_end],
+                other.score[class_start:class_end],
+                other.box[class_start:class_end],
+                other.image_passed[image_start:image_end])
+
+    @property
+    def group(self):
+        self._compact()
+        # Groups which have a failed image are in front of passed groups
+        passed_groups = list()
+        non_passed_groups = list()
+        for index in range(len(self.group_names)):
+            start = self.image_offsets[index]
+            end = self.image_offsets[index + 1]
+            if np.all(self.image_passed[start:end]):
+                passed_groups.append(TestResultGroupView(self, index))
+            else:
+                non_passed_groups.insert(0, TestResultGroupView(self, index))
+
+        return non_passed_groups + passed_groups
+
+    def get_classes(self, image_index):
+        self._compact()
+        start = self.class_offsets[image_index]
+        end = self.class_offsets[image_index + 1]
+
+        classes = list()
+        for label, score, box in zip(self.label[start:end].tolist(),
+                                     self.score[start:end].tolist(),
+                                     self.box[start:end].tolist()):
+            result_class = TestResultClass()
+            result_class.name = self.label_names.get(label)
+            result_class.label = label
+            result_class.score = score
+            result_class.box = box
+            classes.append(result_class)
+
+        return classes
+
+    # Move appended groups to the contiguous arrays
+    def _compact(self):
+        if len(self._pending) == 0:
+            return
+
+        image_index = [self.image_index]
+        class_offsets = [self.class_offsets]
+        image_offsets = [self.image_offsets]
+        image_count = len(self.image_passed)
+        class_count = self.class_offsets[-1]
+        for group_image_index, _, _, _, image_passed in self._pending:
+            group_image_count = len(image_passed)
+            image_index.append(group_image_index + image_count)
+            class_counts = np.bincount(
+                group_image_index, minlength=group_image_count)
+            class_offsets.append(class_count + np.cumsum(class_counts))
+            image_count = image_count + group_image_count
+            class_count = class_count + len(group_image_index)
+            image_offsets.append(np.array([image_count], dtype=np.int64))
+
+        self.image_index = np.concatenate(image_index)
+        self.label = np.concatenate(
+            [self.label] + [label.astype(np.int32) for _, label, _, _, _ in self._pending])
+        self.score = np.concatenate(
+            [self.score] + [score for _, _, score, _, _ in self._pending])
+        self.box = np.concatenate(
+            [self.box] + [box.reshape(-1, 4) for _, _, _, box, _ in self._pending])
+        self.class_offsets = np.concatenate(class_offsets).astype(np.int64)
+        self.image_offsets = np.concatenate(image_offsets)
+        self.image_passed = np.concatenate(
+            [self.image_passed] + [image_passed for _, _, _, _, image_passed in self._pending])
+        self._pending = list()
+
+
+# View of a group in ColumnarTestResult (same fields as TestResultGroup)
+class TestResultGroupView(object):
+
+    def __init__(self, result, index):
+        self._result = result
+        self.name = result.group_names[index]
+        self.required_classes = result.group_required_classes[index]
+        self._start = result.image_offsets[index]
+        self._end = result.image_offsets[index + 1]
+
+    @property
+    def images(self):
+        return [TestResultImageView(self._result, index)
+                for index in range(self._start, self._end)]
+
+
+# View of an image in ColumnarTestResult (same fields as TestResultImage)
+class TestResultImageView(object):
+
+    def __init__(self, result, index):
+        self._result = result
+        self._index = index
+        self.name = result.image_names[index]
+        self.filepath = result.image_filepaths[index]
+
+    @property
+    def classes(self):
+        return self._result.get_classes(self._index)
+
+    def sort_classes(self):
+        # Already sorted by label
+        pass
+
+
+# Result which keeps only aggregates of each group in memory.
+# Images of a group are built by `build_group` (returns a one group
+# TestResult) when the result dialog adds the group to its list (a page of
+# groups at a time, as it is scrolled), and dropped with the dialog.
+class SpilledTestResult(TestResult):
+
+    def __init__(self):
+        self.passed_count = 0
+        self.tested_count = 0
+        self._groups = list()
+
+    def append_group(self, name, required_classes, passed_count, tested_count, build_group):
+        self.passed_count = self.passed_count + passed_count
+        self.tested_count = self.tested_count + tested_count
+        self._groups.append(SpilledTestResultGroupView(
+            name, required_classes, passed_count == tested_count, build_group))
+
+    @property
+    def group(self):
+        # Groups which have a failed image are in front of passed groups
+        passed_groups = list()
+        non_passed_groups = list()
+        for group_view in self._groups:
+            if group_view.passed:
+                passed_groups.append(group_view)
+            else:
+                non_passed_groups.insert(0, group_view)
+
+        return non_passed_groups + passed_groups
+
+
+# View of a group in SpilledTestResult (same fields as TestResultGroup)
+class SpilledTestResultGroupView(object):
+
+    def __init__(self, name, required_classes, passed, build_group):
+        self.name = name
+        self.required_classes = required_classes
+        self.passed = passed
+        self._build_group = build_group
+
+    @property
+    def images(self):
+        return self._build_group().group[0].images
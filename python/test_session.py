@@ -5,10 +5,66 @@ import tensorflow as tf
 import numpy as np
 import cv2
 import os
+import io
+import hashlib
+import re
+import time
+import collections
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
+from tensorflow.core.protobuf import saved_model_pb2
 
 from config import Config
-from config import CONFIG_KEY_RESULT_CUTOFF_THRESHOLD
+from config import CONFIG_KEY_FEED_RAW_IMAGE_BYTES
+from config import CONFIG_KEY_ENCODER_FORMAT
+from config import CONFIG_KEY_ENCODER_QUALITY
+from config import CONFIG_KEY_BATCH_SIZE
+from config import CONFIG_KEY_PREFETCH_DEPTH
+from config import CONFIG_KEY_PREFETCH_LOADERS
+from config import CONFIG_KEY_CONCURRENT_RUNS
+from config import CONFIG_KEY_MODEL_CACHE_BUDGET_MB
+from config import CONFIG_KEY_INFERENCE_CACHE_ENABLED
+from config import CONFIG_KEY_INFERENCE_CACHE_BUDGET_MB
+from config import CONFIG_KEY_INFERENCE_CACHE_MAX_AGE_DAYS
+from config import CONFIG_KEY_STREAM_GROUP_RESULTS
+from config import CONFIG_KEY_BOUNDED_MEMORY
+from config import CONFIG_KEY_RUN_JOURNAL_ENABLED
+from config import CONFIG_KEY_DATASET_SCAN_WORKERS
+from config import CONFIG_KEY_INTRA_OP_PARALLELISM_THREADS
+from config import CONFIG_KEY_INTER_OP_PARALLELISM_THREADS
+from config import CONFIG_KEY_GRAPH_OPTIMIZER_LEVEL
+from config import CONFIG_KEY_XLA_JIT
+from config import CONFIG_KEY_USE_PER_SESSION_THREADS
+from config import CONFIG_KEY_USE_TUNED_SESSION_SETTINGS
+from config import CONFIG_KEY_USE_TUNED_RUN_SETTINGS
+from config import CONFIG_KEY_OPTIMIZED_GRAPH_ENABLED
+from image_prefetcher import ImagePrefetcher
+from raw_output_store import RawOutputStore
+from spilled_output_store import DetectionSegment, SpilledOutputStore
+from detection_postprocess import split_batch_outputs
+from saved_model_fingerprint import get_saved_model_fingerprint
+from saved_model_fingerprint import get_saved_model_size
+from model_cache import ModelCache
+from inference_cache import InferenceCache
+from run_journal import RunJournal, get_dataset_snapshot
+from packed_dataset import PackedDataset, get_packed_dataset_path
+from optimized_graph import get_optimized_graph_file_name
+from optimized_graph import get_optimized_graph_failed_file_name
+from optimized_graph import optimize_saved_model, read_optimized_graph
+from session_tuning import TuningStore, SESSION_TUNING_FILE_NAME
+from session_tuning import get_session_setting_axes, tune_settings
+from session_tuning import get_run_setting_axes, tune_run_settings
+from session_tuning import RUN_TUNING_FILE_NAME
+from session_tuning import RUN_SETTING_BATCH_SIZE
+from session_tuning import RUN_SETTING_CONCURRENT_RUNS
+from session_tuning import SESSION_SETTING_INTRA_OP_THREADS
+from session_tuning import SESSION_SETTING_INTER_OP_THREADS
+from session_tuning import SESSION_SETTING_GRAPH_OPTIMIZER_LEVEL
+from session_tuning import SESSION_SETTING_XLA_JIT
+from session_tuning import SESSION_SETTING_USE_PER_SESSION_THREADS
+from session_tuning import GRAPH_OPTIMIZER_LEVEL_L0
+from session_tuning import GRAPH_OPTIMIZER_LEVEL_L1
+from autotune_probe import ProbeRunner, THREAD_SETTING_KEYS
 
 # Constants for status of this session
 SESSION_STATUS_LOAD_FAILED = 0
@@ -17,175 +73,1193 @@ SESSION_STATUS_PREDICTION_STARTED = 2
 SESSION_STATUS_PREDICTION_FAILED = 3
 SESSION_STATUS_PREDICTION_SUCCESS = 4
 
+# Input types of exported detection model (same as `input_type` of exporter)
+INPUT_TYPE_ENCODED_IMAGE_STRING = 'encoded_image_string_tensor'
+INPUT_TYPE_IMAGE_TENSOR = 'image_tensor'
+INPUT_TYPE_TF_EXAMPLE = 'tf_example'
+INPUT_TYPES = [INPUT_TYPE_ENCODED_IMAGE_STRING,
+               INPUT_TYPE_IMAGE_TENSOR, INPUT_TYPE_TF_EXAMPLE]
 
-def _create_encoded_image_string(image_array_np, encoding_format):
-    od_graph = tf.Graph()
-    with od_graph.as_default():
-        if encoding_format == 'jpg':
-            encoded_string = tf.image.encode_jpeg(image_array_np)
-        elif encoding_format == 'png':
-            encoded_string = tf.image.encode_png(image_array_np)
-        else:
-            raise ValueError(
-                'Supports only the following formats: `jpg`, `png`')
-    with tf.Session(graph=od_graph):
-        return encoded_string.eval()
+# Keys of output tensors which are fetched from the detection model
+OUTPUT_KEYS = ['num_detections', 'detection_boxes', 'detection_scores',
+               'detection_classes', 'detection_masks']
+
+# File name of the inference cache in the cache directory
+INFERENCE_CACHE_FILE_NAME = 'inference_cache.sqlite'
+
+# File name of the detection segment of a run in bounded memory mode
+DETECTION_SEGMENT_FILE_NAME = 'detection_segment_{pid}_{run}'
+DETECTION_SEGMENT_FILE_PATTERN = re.compile(r'^detection_segment_(\d+)_\d+\.(det|cnt)$')
+
+# File name of the journal of the last run in the cache directory
+RUN_JOURNAL_FILE_NAME = 'run_journal.jsonl'
+
+# Size of dummy image for warming up the loaded model
+WARM_UP_IMAGE_SHAPE = (64, 64, 3)
+
+# Number of sample images and seconds of each probe in autotune
+AUTOTUNE_SAMPLE_COUNT = 32
+AUTOTUNE_PROBE_SECONDS = 3
+
+# Config keys of session settings
+SESSION_SETTING_CONFIG_KEYS = [
+    (SESSION_SETTING_INTRA_OP_THREADS, CONFIG_KEY_INTRA_OP_PARALLELISM_THREADS, int),
+    (SESSION_SETTING_INTER_OP_THREADS, CONFIG_KEY_INTER_OP_PARALLELISM_THREADS, int),
+    (SESSION_SETTING_GRAPH_OPTIMIZER_LEVEL, CONFIG_KEY_GRAPH_OPTIMIZER_LEVEL, str),
+    (SESSION_SETTING_XLA_JIT, CONFIG_KEY_XLA_JIT, bool),
+    (SESSION_SETTING_USE_PER_SESSION_THREADS, CONFIG_KEY_USE_PER_SESSION_THREADS, bool),
+]
+
+
+# Build an encoder on the current default graph, It is built once with
+# the model graph and takes an uint8 HWC image through its placeholder
+def _build_image_encoder(encoding_format='jpg', quality=95):
+    image_input = tf.placeholder(
+        tf.uint8, shape=[None, None, 3], name='test_suite_encoder_input')
+    if encoding_format == 'jpg':
+        encoded_string = tf.image.encode_jpeg(image_input, quality=quality)
+    elif encoding_format == 'png':
+        encoded_string = tf.image.encode_png(image_input)
+    else:
+        raise ValueError(
+            'Supports only the following formats: `jpg`, `png`')
+    return image_input, encoded_string
+
+
+# Metadata of loaded saved models by (path, mtime of saved_model.pb)
+_saved_model_metadata_cache = dict()
+
+
+# Resolve the input type and tensor names of a saved model, The result is
+# cached so reloading an unchanged export skips parsing the graph again
+def _get_saved_model_metadata(saved_model_path):
+    saved_model_file = os.path.join(saved_model_path, 'saved_model.pb')
+    cache_key = (os.path.abspath(saved_model_path),
+                 os.stat(saved_model_file).st_mtime_ns)
+    if cache_key in _saved_model_metadata_cache:
+        return _saved_model_metadata_cache[cache_key]
+
+    saved_model = saved_model_pb2.SavedModel()
+    with open(saved_model_file, mode='rb') as f:
+        saved_model.ParseFromString(f.read())
+
+    metadata = None
+    for meta_graph in saved_model.meta_graphs:
+        if 'serve' in meta_graph.meta_info_def.tags:
+            metadata = _read_metadata_from_meta_graph(meta_graph)
+            break
+
+    if metadata is None:
+        raise ValueError('There is no serving graph in the saved model')
+
+    _saved_model_metadata_cache[cache_key] = metadata
+    return metadata
+
+
+def _read_metadata_from_meta_graph(meta_graph):
+    metadata = {'input_type': None, 'output_tensor_names': dict()}
+
+    # Exporter of object detection writes `serving_default` signature
+    if 'serving_default' in meta_graph.signature_def:
+        signature = meta_graph.signature_def['serving_default']
+        for tensor_info in signature.inputs.values():
+            input_type = tensor_info.name.split(':')[0]
+            if input_type in INPUT_TYPES:
+                metadata['input_type'] = input_type
+        for key, tensor_info in signature.outputs.items():
+            if key in OUTPUT_KEYS:
+                metadata['output_tensor_names'][key] = tensor_info.name
+    else:
+        # Old exports without signature, look up the nodes by their names
+        node_names = {node.name for node in meta_graph.graph_def.node}
+        for input_type in INPUT_TYPES:
+            if input_type in node_names:
+                metadata['input_type'] = input_type
+                break
+        for key in OUTPUT_KEYS:
+            if key in node_names:
+                metadata['output_tensor_names'][key] = key + ':0'
+
+    if metadata['input_type'] is None:
+        raise ValueError('There is no supported input in the saved model')
+
+    return metadata
+
+
+# Wrap an encoded image to serialized tf.Example for `tf_example` input
+def _create_tf_example_string(encoded_image):
+    example = tf.train.Example(features=tf.train.Features(feature={
+        'image/encoded': tf.train.Feature(
+            bytes_list=tf.train.BytesList(value=[encoded_image])),
+    }))
+    return example.SerializeToString()
+
+
+# Graph, session and handles to tensors of a loaded saved model
+class LoadedModel(object):
+
+    def __init__(self, saved_model_path, load_options):
+        self.saved_model_path = saved_model_path
+        # (path, fingerprint, encoder options, session settings) which the
+        # model is loaded with
+        self.load_options = load_options
+        self.graph = tf.Graph()
+        self.sess = None
+        self.metadata = None
+        # Path to the optimized graph which is loaded instead of the saved
+        # model, None if the saved model is loaded
+        self.optimized_graph_path = None
+        self.input_type = None
+        self.encoder_input = None
+        self.encoded_string = None
+        self.image_tensor = None
+        self.tensor_dict = None
+        self.dataset_runner = None
+
+    def close(self):
+        if self.dataset_runner is not None:
+            self.dataset_runner['sess'].close()
+            self.dataset_runner = None
+        if self.sess is not None:
+            self.sess.close()
+            self.sess = None
+
+
+# Import the graph of the model to the default graph of the session,
+# The optimized graph has no variables to restore
+def _import_model_graph(model, sess, input_map=None):
+    if model.optimized_graph_path is None:
+        tf.saved_model.loader.load(
+            sess, ["serve"], model.saved_model_path, input_map=input_map)
+    else:
+        tf.import_graph_def(read_optimized_graph(model.optimized_graph_path),
+                            input_map=input_map, name='')
+
+
+# Whether a process of the pid is running, It is assumed to be running if
+# it can't be checked (os.kill terminates the process on Windows)
+def _is_process_alive(pid):
+    if pid == os.getpid() or os.name != 'posix':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+# Get handles to output tensors of the detection model
+def _get_output_tensor_dict(graph, metadata):
+    return {key: graph.get_tensor_by_name(tensor_name)
+            for key, tensor_name in metadata['output_tensor_names'].items()}
 
 
 class TestSession(QtCore.QObject):
     sigTestSessionStatus = QtCore.pyqtSignal(int)
     sigTestSessionCount = QtCore.pyqtSignal(int, int)
     sigTestSessionResult = QtCore.pyqtSignal(dict)
+    # (group name, RawOutputStore) of a finished group in streaming mode
+    sigTestSessionGroupResult = QtCore.pyqtSignal(str, object)
+    sigTestSessionMessage = QtCore.pyqtSignal(str)
 
     def __init__(self, parent=None, config=None):
         super().__init__(parent)
-        self._graph = None
+        self._model = None
+        self._model_cache = ModelCache()
         self._config = config
+        # Image count of each group in the current prediction
+        self._group_image_counts = dict()
+        self._stream_group_results = False
+        # Segment of the current run in bounded memory mode
+        self._detection_segment = None
+        self._run_count = 0
+        # (group name, image file) of all images, their hashes (None if
+        # unknown yet), [size, mtime_ns] (None if not scanned) and journal
+        # of current run
+        self._run_items = []
+        self._run_hashes = []
+        self._run_stats = None
+        self._journal = None
+        # Batches failed in current run, images are run one at a time
+        self._single_image_runs = False
+        # Packed test data of current run, None if it is read from files
+        self._packed_dataset = None
+        # (intra op threads, inter op threads) of sessions created later
+        self._thread_limit = None
 
     def set_config(self, config):
         self._config = config
 
     def loadSavedModel(self, saved_model_path):
+        try:
+            if self._config:
+                self._model_cache.set_budget(self._config.get(
+                    CONFIG_KEY_MODEL_CACHE_BUDGET_MB, get_type=int) * 1024 * 1024)
+            fingerprint = get_saved_model_fingerprint(saved_model_path)
+            session_settings = self._get_session_settings(fingerprint)
+            encoding_format, encoding_quality, load_options = self._get_load_options(
+                saved_model_path, fingerprint, session_settings)
+
+            # Keep the loaded model if nothing is changed
+            if self._model is not None and self._model.load_options == load_options:
+                self.sigTestSessionStatus.emit(SESSION_STATUS_LOAD_SUCCESS)
+                return
+        except:
+            self.sigTestSessionStatus.emit(SESSION_STATUS_LOAD_FAILED)
+            return
+
         self.reset()
+
+        # Switch to recently used model without loading
+        self._model = self._model_cache.get(load_options)
+        if self._model is not None:
+            self._emit_model_cache_status('hit')
+            self.sigTestSessionStatus.emit(SESSION_STATUS_LOAD_SUCCESS)
+            return
+
         # Load the saved model from file
         try:
-            self._graph = tf.Graph()
-            tf_config = tf.ConfigProto()
-            tf_config.gpu_options.per_process_gpu_memory_fraction = 0.2
-            with tf.Session(graph=self._graph, config=tf_config) as sess:
-                tf.saved_model.loader.load(sess, ["serve"], saved_model_path)
-                # Get handles to input and output tensors
-                ops = tf.get_default_graph().get_operations()
-                all_tensor_names = {
-                    output.name for op in ops for output in op.outputs}
-
-                self._tensor_dict = {}
-                for key in ['num_detections', 'detection_boxes', 'detection_scores',
-                            'detection_classes', 'detection_masks']:
-                    tensor_name = key + ':0'
-                    if tensor_name in all_tensor_names:
-                        self._tensor_dict[key] = tf.get_default_graph(
-                        ).get_tensor_by_name(tensor_name)
-
-                self._image_tensor = tf.get_default_graph().get_tensor_by_name(
-                    'encoded_image_string_tensor:0')
+            self._model = self._load_model(
+                saved_model_path, load_options, encoding_format, encoding_quality,
+                session_settings)
+
+            # First prediction should not pay for lazy initialization
+            self.warm_up()
 
+            self._model_cache.put(load_options, self._model,
+                                  get_saved_model_size(saved_model_path))
+            self._emit_model_cache_status('miss')
             self.sigTestSessionStatus.emit(SESSION_STATUS_LOAD_SUCCESS)
         except:
+            self.reset()
             self.sigTestSessionStatus.emit(SESSION_STATUS_LOAD_FAILED)
 
+    # Returns (encoding format, encoding quality, load options)
+    def _get_load_options(self, saved_model_path, fingerprint, session_settings):
+        encoding_format = 'jpg'
+        encoding_quality = 95
+        if self._config:
+            encoding_format = self._config.get(CONFIG_KEY_ENCODER_FORMAT)
+            encoding_quality = self._config.get(
+                CONFIG_KEY_ENCODER_QUALITY, get_type=int)
+        load_options = (os.path.abspath(saved_model_path), fingerprint,
+                        encoding_format, encoding_quality,
+                        tuple(sorted(session_settings.items())))
+        return encoding_format, encoding_quality, load_options
+
+    def _load_model(self, saved_model_path, load_options, encoding_format, encoding_quality,
+                    session_settings):
+        model = LoadedModel(saved_model_path, load_options)
+        try:
+            model.metadata = _get_saved_model_metadata(saved_model_path)
+            model.input_type = model.metadata['input_type']
+            model.optimized_graph_path = self._get_optimized_graph_path(
+                saved_model_path, load_options[1], model.metadata, session_settings)
+            # Keep the session opened, It holds the restored variables
+            # and is reused by every prediction until the model is closed
+            model.sess = tf.Session(
+                graph=model.graph, config=self._create_session_config(session_settings))
+            with model.graph.as_default():
+                model.encoder_input, model.encoded_string = _build_image_encoder(
+                    encoding_format, encoding_quality)
+                if model.input_type == INPUT_TYPE_ENCODED_IMAGE_STRING:
+                    # The model input falls back to the encoder output when
+                    # encoded strings are not fed, so an ndarray is encoded
+                    # and predicted in a single sess.run
+                    model.image_tensor = tf.placeholder_with_default(
+                        tf.expand_dims(model.encoded_string, 0), shape=[None],
+                        name='test_suite_encoded_image_string')
+                    _import_model_graph(
+                        model, model.sess,
+                        input_map={model.input_type + ':0': model.image_tensor})
+                else:
+                    _import_model_graph(model, model.sess)
+                    model.image_tensor = model.graph.get_tensor_by_name(
+                        model.input_type + ':0')
+            # Get handles to output tensors
+            model.tensor_dict = _get_output_tensor_dict(
+                model.graph, model.metadata)
+        except:
+            model.close()
+            raise
+
+        return model
+
+    # Path to the optimized graph of the saved model in the cache directory,
+    # The graph is optimized once for a fingerprint. None if it is disabled
+    # or the saved model can't be optimized (it is tried once, a marker file
+    # of the failure is kept). The saved model is loaded with the session
+    # settings, the first session of the process sizes its thread pools
+    def _get_optimized_graph_path(self, saved_model_path, fingerprint, metadata,
+                                  session_settings):
+        if not self._config or \
+                not self._config.get(CONFIG_KEY_OPTIMIZED_GRAPH_ENABLED, get_type=bool):
+            return None
+
+        graph_path = self._config.get_cache_file_path(
+            get_optimized_graph_file_name(fingerprint))
+        failed_path = self._config.get_cache_file_path(
+            get_optimized_graph_failed_file_name(fingerprint))
+        if os.path.isfile(failed_path):
+            return None
+
+        if not os.path.isfile(graph_path):
+            try:
+                start_time = time.time()
+                optimize_saved_model(saved_model_path, metadata, graph_path,
+                                     self._create_session_config(session_settings))
+                self.sigTestSessionMessage.emit(
+                    'Optimized graph of the saved model in {:.1f} sec'.format(
+                        time.time() - start_time))
+            except Exception as e:
+                with open(failed_path, mode='w', encoding='utf-8') as f:
+                    f.write(str(e))
+                self.sigTestSessionMessage.emit(
+                    'Failed to optimize graph, The saved model is loaded: {}'.format(e))
+                return None
+
+        return graph_path
+
+    # Remove files of this session, Called when the app is shut down
+    def close(self):
+        if self._detection_segment is not None:
+            self._detection_segment.remove()
+            self._detection_segment = None
+
+    # Detach the current model, It stays opened while it is in the cache
     def reset(self):
-        self._graph = None
+        if self._model is not None and \
+                not self._model_cache.contains(self._model.load_options):
+            self._model.close()
+        self._model = None
         tf.reset_default_graph()
 
+    def _emit_model_cache_status(self, status):
+        self.sigTestSessionMessage.emit(
+            'Model cache {}: {} hits, {} misses, {} models ({:.1f}MB)'.format(
+                status,
+                self._model_cache.hit_count,
+                self._model_cache.miss_count,
+                self._model_cache.get_count(),
+                self._model_cache.get_size() / (1024 * 1024)))
+
+    # Run a dummy inference to initialize kernels of the loaded model
+    def warm_up(self):
+        if self._model is None:
+            return
+        self._run_batch([np.zeros(WARM_UP_IMAGE_SHAPE, dtype=np.uint8)])
+
+    def get_fingerprint(self):
+        if self._model is None:
+            return None
+        return self._model.load_options[1]
+
+    # Limit threads of TF thread pools, It is applied to sessions of models
+    # loaded after this call (ex: a shard process sharing cores with others)
+    def set_thread_limit(self, intra_op_threads, inter_op_threads):
+        self._thread_limit = (intra_op_threads, inter_op_threads)
+
+    # Session settings of the config, Tuned settings of the model take
+    # precedence of them and the thread limit takes precedence of all
+    def _get_session_settings(self, fingerprint):
+        settings = {
+            SESSION_SETTING_INTRA_OP_THREADS: 0,
+            SESSION_SETTING_INTER_OP_THREADS: 0,
+            SESSION_SETTING_GRAPH_OPTIMIZER_LEVEL: GRAPH_OPTIMIZER_LEVEL_L1,
+            SESSION_SETTING_XLA_JIT: False,
+            SESSION_SETTING_USE_PER_SESSION_THREADS: False,
+        }
+        if self._config:
+            for setting_key, config_key, get_type in SESSION_SETTING_CONFIG_KEYS:
+                settings[setting_key] = self._config.get(config_key, get_type=get_type)
+            if self._config.get(CONFIG_KEY_USE_TUNED_SESSION_SETTINGS, get_type=bool):
+                tuned_settings = TuningStore(self._config.get_cache_file_path(
+                    SESSION_TUNING_FILE_NAME)).get(fingerprint)
+                if tuned_settings:
+                    settings.update(tuned_settings)
+
+        if self._thread_limit is not None:
+            settings[SESSION_SETTING_INTRA_OP_THREADS] = self._thread_limit[0]
+            settings[SESSION_SETTING_INTER_OP_THREADS] = self._thread_limit[1]
+        return settings
+
+    def _create_session_config(self, session_settings):
+        tf_config = tf.ConfigProto()
+        tf_config.gpu_options.per_process_gpu_memory_fraction = 0.2
+        tf_config.intra_op_parallelism_threads = \
+            session_settings[SESSION_SETTING_INTRA_OP_THREADS]
+        tf_config.inter_op_parallelism_threads = \
+            session_settings[SESSION_SETTING_INTER_OP_THREADS]
+        tf_config.use_per_session_threads = \
+            session_settings[SESSION_SETTING_USE_PER_SESSION_THREADS]
+        optimizer_options = tf_config.graph_options.optimizer_options
+        if session_settings[SESSION_SETTING_GRAPH_OPTIMIZER_LEVEL] == GRAPH_OPTIMIZER_LEVEL_L0:
+            optimizer_options.opt_level = tf.OptimizerOptions.L0
+        else:
+            optimizer_options.opt_level = tf.OptimizerOptions.L1
+        if session_settings[SESSION_SETTING_XLA_JIT]:
+            optimizer_options.global_jit_level = tf.OptimizerOptions.ON_1
+        return tf_config
+
+    # Find session settings giving the best images/sec for the loaded model
+    # with sample images of the test data, They are kept for the model and
+    # the model is loaded again with them. Returns the settings
+    # (Settings are probed in other processes, see ProbeRunner)
+    def autotune_session_settings(self, data_path, test_group):
+        if self._model is None:
+            raise ValueError('There is no loaded model to tune')
+
+        saved_model_path = self._model.saved_model_path
+        fingerprint = self.get_fingerprint()
+        session_settings = dict(self._model.load_options[4])
+        batch_size, concurrent_runs = self._get_run_settings()
+        probe_runner = ProbeRunner(
+            saved_model_path, data_path, self._get_sample_group(test_group))
+
+        def measure(settings):
+            try:
+                throughput = probe_runner.measure(settings, batch_size, concurrent_runs)
+            except RuntimeError as e:
+                self.sigTestSessionMessage.emit('Autotune: {}'.format(e))
+                throughput = 0.0
+
+            self.sigTestSessionMessage.emit(
+                'Autotune: {:.1f} images/sec with {}'.format(throughput, settings))
+            return throughput
+
+        try:
+            best_settings, best_throughput = tune_settings(
+                measure, session_settings, get_session_setting_axes())
+        finally:
+            probe_runner.close()
+
+        if self._config:
+            TuningStore(self._config.get_cache_file_path(
+                SESSION_TUNING_FILE_NAME)).put(fingerprint, best_settings)
+        self.sigTestSessionMessage.emit(
+            'Autotune: best {:.1f} images/sec with {}'.format(
+                best_throughput, best_settings))
+        self._emit_thread_settings_message(session_settings, best_settings)
+
+        self.loadSavedModel(saved_model_path)
+        return best_settings
+
+    # Thread pools of this process are sized by its first session already
+    def _emit_thread_settings_message(self, session_settings, tuned_settings):
+        if any(session_settings[key] != tuned_settings[key] for key in THREAD_SETTING_KEYS):
+            self.sigTestSessionMessage.emit(
+                'Autotune: Tuned thread settings are applied after restarting the app.')
+
+    # Measure images/sec of the saved model loaded with the session settings
+    # in this process (a probe process of ProbeRunner)
+    def probe_throughput(self, saved_model_path, session_settings, data_path, sample_group,
+                         batch_size, concurrent_runs):
+        encoding_format, encoding_quality, load_options = self._get_load_options(
+            saved_model_path, get_saved_model_fingerprint(saved_model_path), session_settings)
+        model = self._load_model(saved_model_path, load_options,
+                                 encoding_format, encoding_quality, session_settings)
+        current_model = self._model
+        self._model = model
+        self._single_image_runs = False
+        try:
+            sample_inputs = self._load_sample_inputs(data_path, sample_group)
+            return self._measure_throughput(
+                model, sample_inputs, batch_size, concurrent_runs)
+        finally:
+            self._model = current_model
+            model.close()
+
+    # Find batch size, concurrent runs and intra op threads giving the best
+    # images/sec for the loaded model, Each of them is increased up to the
+    # knee of throughput. They are kept for the model and used by later
+    # group predictions if `use_tuned_run_settings`. Returns the settings
+    # (Settings are probed in other processes, see ProbeRunner)
+    def autotune_run_settings(self, data_path, test_group):
+        if self._model is None:
+            raise ValueError('There is no loaded model to tune')
+
+        saved_model_path = self._model.saved_model_path
+        fingerprint = self.get_fingerprint()
+        session_settings = dict(self._model.load_options[4])
+        probe_runner = ProbeRunner(
+            saved_model_path, data_path, self._get_sample_group(test_group))
+
+        def measure(thread_count, concurrent_runs, batch_size):
+            settings = dict(session_settings)
+            settings[SESSION_SETTING_INTRA_OP_THREADS] = thread_count
+            try:
+                throughput = probe_runner.measure(settings, batch_size, concurrent_runs)
+            except RuntimeError as e:
+                # ex: out of memory with a large batch
+                self.sigTestSessionMessage.emit('Autotune: {}'.format(e))
+                throughput = 0.0
+
+            self.sigTestSessionMessage.emit(
+                'Autotune: {:.1f} images/sec with {} threads, {} runs, batch {}'.format(
+                    throughput, thread_count, concurrent_runs, batch_size))
+            return throughput
+
+        try:
+            best_settings, best_throughput = tune_run_settings(
+                measure, *get_run_setting_axes())
+        finally:
+            probe_runner.close()
+
+        if self._config:
+            TuningStore(self._config.get_cache_file_path(RUN_TUNING_FILE_NAME)).put(
+                fingerprint, {
+                    RUN_SETTING_BATCH_SIZE: best_settings[RUN_SETTING_BATCH_SIZE],
+                    RUN_SETTING_CONCURRENT_RUNS: best_settings[RUN_SETTING_CONCURRENT_RUNS],
+                })
+            # Thread count is a session setting
+            session_store = TuningStore(
+                self._config.get_cache_file_path(SESSION_TUNING_FILE_NAME))
+            tuned_settings = dict(session_store.get(fingerprint) or session_settings)
+            tuned_settings[SESSION_SETTING_INTRA_OP_THREADS] = \
+                best_settings[SESSION_SETTING_INTRA_OP_THREADS]
+            session_store.put(fingerprint, tuned_settings)
+            self._emit_thread_settings_message(session_settings, tuned_settings)
+        self.sigTestSessionMessage.emit(
+            'Autotune: best {:.1f} images/sec with {}'.format(
+                best_throughput, best_settings))
+        if self._config is None or \
+                not self._config.get(CONFIG_KEY_USE_TUNED_RUN_SETTINGS, get_type=bool):
+            self.sigTestSessionMessage.emit(
+                'Autotune: Batch size and concurrent runs are used by runs if '
+                '`use_tuned_run_settings` is enabled. They are tuned with {} '
+                'sample images only.'.format(AUTOTUNE_SAMPLE_COUNT))
+
+        self.loadSavedModel(saved_model_path)
+        return best_settings
+
+    # (batch size, concurrent runs) of the config, Tuned settings of the
+    # loaded model take precedence of them
+    def _get_run_settings(self):
+        batch_size = 1
+        concurrent_runs = 1
+        if self._config:
+            batch_size = max(1, self._config.get(
+                CONFIG_KEY_BATCH_SIZE, get_type=int))
+            concurrent_runs = max(1, self._config.get(
+                CONFIG_KEY_CONCURRENT_RUNS, get_type=int))
+            if self._model is not None and \
+                    self._config.get(CONFIG_KEY_USE_TUNED_RUN_SETTINGS, get_type=bool):
+                tuned_settings = TuningStore(self._config.get_cache_file_path(
+                    RUN_TUNING_FILE_NAME)).get(self.get_fingerprint())
+                if tuned_settings:
+                    batch_size = tuned_settings[RUN_SETTING_BATCH_SIZE]
+                    concurrent_runs = tuned_settings[RUN_SETTING_CONCURRENT_RUNS]
+
+        return batch_size, concurrent_runs
+
+    # Group of AUTOTUNE_SAMPLE_COUNT images spread over test groups
+    def _get_sample_group(self, test_group):
+        test_items = []
+        for group_name, group_data in test_group.items():
+            test_items.extend([(group_name, image_file)
+                               for image_file in group_data.get('test_data', [])])
+        if len(test_items) == 0:
+            raise ValueError('There is no image to tune with')
+
+        sample_group = dict()
+        step = max(1, len(test_items) // AUTOTUNE_SAMPLE_COUNT)
+        for group_name, image_file in test_items[::step][:AUTOTUNE_SAMPLE_COUNT]:
+            sample_group.setdefault(group_name, {'test_data': []})
+            sample_group[group_name]['test_data'].append(image_file)
+        return sample_group
+
+    # Images of the sample group, loaded as they are fed in a run
+    def _load_sample_inputs(self, data_path, sample_group):
+        feed_raw_bytes = True
+        if self._config:
+            feed_raw_bytes = self._config.get(
+                CONFIG_KEY_FEED_RAW_IMAGE_BYTES, get_type=bool)
+
+        self._open_packed_dataset(data_path)
+        return [self._load_test_image(data_path, (group_name, image_file), feed_raw_bytes)[1]
+                for group_name, group_data in sample_group.items()
+                for image_file in group_data['test_data']]
+
+    # Images/sec of the model running batches of the inputs (repeated) from
+    # `concurrent_runs` threads for AUTOTUNE_PROBE_SECONDS
+    def _measure_throughput(self, model, image_inputs, batch_size, concurrent_runs=1):
+        current_model = self._model
+        self._model = model
+        try:
+            # First run pays for lazy initialization
+            self._run_batch([image_inputs[index % len(image_inputs)]
+                             for index in range(batch_size)])
+
+            def run_batches(offset):
+                image_count = 0
+                while time.time() - start_time < AUTOTUNE_PROBE_SECONDS:
+                    self._run_batch([
+                        image_inputs[(offset + image_count + index) % len(image_inputs)]
+                        for index in range(batch_size)])
+                    image_count = image_count + batch_size
+                return image_count
+
+            start_time = time.time()
+            with ThreadPoolExecutor(max_workers=concurrent_runs) as executor:
+                image_count = sum(executor.map(
+                    run_batches, [index * batch_size for index in range(concurrent_runs)]))
+            return image_count / (time.time() - start_time)
+        finally:
+            self._model = current_model
+
     # Predict just an image
     @QtCore.pyqtSlot(np.ndarray)
     def slot_predict(self, input_data: np.ndarray):
-        if self._graph is None:
+        if self._model is None:
             self.sigTestSessionStatus.emit(SESSION_STATUS_PREDICTION_FAILED)
             return
         try:
-            with self._graph.as_default():
-                with tf.Session() as sess:
-                    self.sigTestSessionStatus.emit(
-                        SESSION_STATUS_PREDICTION_STARTED)
-
-                    # Encode to image string
-                    jpg_image_str = _create_encoded_image_string(
-                        input_data, 'jpg')
-
-                    # Run inference
-                    output_dict = sess.run(self._tensor_dict, feed_dict={
-                        self._image_tensor: [jpg_image_str]})
-
-                    # all outputs are float32 numpy arrays, so convert types as appropriate
-                    output_dict['num_detections'] = int(
-                        output_dict['num_detections'][0])
-                    output_dict['detection_classes'] = output_dict['detection_classes'][0].astype(
-                        np.uint8)
-                    output_dict['detection_boxes'] = output_dict['detection_boxes'][0]
-                    output_dict['detection_scores'] = output_dict['detection_scores'][0]
-
-                    self.sigTestSessionStatus.emit(
-                        SESSION_STATUS_PREDICTION_SUCCESS)
-                    self.sigTestSessionResult.emit(output_dict)
+            self.sigTestSessionStatus.emit(SESSION_STATUS_PREDICTION_STARTED)
+
+            # Run inference
+            output_dict = self._run_batch([input_data])[0]
+
+            self.sigTestSessionStatus.emit(SESSION_STATUS_PREDICTION_SUCCESS)
+            self.sigTestSessionResult.emit(output_dict)
         except:
             self.sigTestSessionStatus.emit(SESSION_STATUS_PREDICTION_FAILED)
 
     # Predict with group of images
+    # Images journaled by the interrupted run are not inferred when resumed
     @QtCore.pyqtSlot(str, dict)
-    def slot_predict_group(self, data_path: str, test_group: dict):
-        if self._graph is None:
+    def slot_predict_group(self, data_path: str, test_group: dict, resume=False):
+        self._single_image_runs = False
+        self._run_items = []
+        self._run_hashes = []
+        self._run_stats = None
+        if self._model is None:
             self.sigTestSessionStatus.emit(SESSION_STATUS_PREDICTION_FAILED)
             return
 
         self.sigTestSessionStatus.emit(SESSION_STATUS_PREDICTION_STARTED)
 
+        inference_cache = None
         try:
-            with self._graph.as_default():
-                with tf.Session() as sess:
-                    total_image_count = self._get_total_image_count(test_group)
-                    current_image_count = 0
-                    cutoff_thres = 0.5
-                    if self._config:
-                        cutoff_thres = self._config.get(
-                            CONFIG_KEY_RESULT_CUTOFF_THRESHOLD, get_type=float)
-
-                    ret_dict = dict()
-                    for group_name, group_data in test_group.items():
-                        ret_result = []
-                        if not 'test_data' in group_data:
-                            continue
-
-                        for image_file in group_data['test_data']:
-                            # Read raw jpeg image and convert to ndarray
-                            image_data = np.asarray(Image.open(
-                                os.path.join(data_path, group_name, image_file)))
-                            # Encode to image string
-                            jpg_image_str = _create_encoded_image_string(
-                                image_data, 'jpg')
-                            # Run inferenc
-                            output_dict = sess.run(self._tensor_dict, feed_dict={
-                                self._image_tensor: [jpg_image_str]})
-
-                            # all outputs are float32 numpy arrays, so convert types as appropriate
-                            output_dict['num_detections'] = int(
-                                output_dict['num_detections'][0])
-                            output_dict['detection_classes'] = output_dict['detection_classes'][0].astype(
-                                np.uint8)
-                            output_dict['detection_boxes'] = output_dict['detection_boxes'][0]
-                            output_dict['detection_scores'] = output_dict['detection_scores'][0]
-
-                            ret_result.append(
-                                self._filter_result_by_thres(output_dict, thres=cutoff_thres))
-
-                            current_image_count = current_image_count + 1
-                            self.sigTestSessionCount.emit(
-                                current_image_count, total_image_count)
-
-                        ret_dict[group_name] = ret_result
-
-                    self.sigTestSessionResult.emit(ret_dict)
+            total_image_count = self._get_total_image_count(test_group)
+            current_image_count = 0
+            feed_raw_bytes = True
+            prefetch_depth = 32
+            prefetch_loaders = 4
+            batch_size, concurrent_runs = self._get_run_settings()
+            if self._config:
+                feed_raw_bytes = self._config.get(
+                    CONFIG_KEY_FEED_RAW_IMAGE_BYTES, get_type=bool)
+                prefetch_depth = self._config.get(
+                    CONFIG_KEY_PREFETCH_DEPTH, get_type=int)
+                prefetch_loaders = self._config.get(
+                    CONFIG_KEY_PREFETCH_LOADERS, get_type=int)
+                if self._config.get(CONFIG_KEY_INFERENCE_CACHE_ENABLED, get_type=bool):
+                    inference_cache = InferenceCache(
+                        self._config.get_cache_file_path(INFERENCE_CACHE_FILE_NAME))
+
+            ret_dict, test_items = self._get_test_items(test_group)
+            self._open_packed_dataset(data_path)
+            current_image_count = self._start_journal(
+                data_path, ret_dict, total_image_count, resume)
+
+            # Images which have cached outputs are not decoded by loaders
+            model_key = self._get_inference_cache_key(feed_raw_bytes)
+            cached_hashes = set()
+            if inference_cache is not None:
+                cached_hashes = inference_cache.get_image_hashes(model_key)
+
+            # Next images are loaded by loader threads while a batch is running
+            prefetcher = ImagePrefetcher(
+                lambda item_index: self._load_test_image(
+                    data_path, test_items[item_index], feed_raw_bytes,
+                    inference_cache is not None, cached_hashes,
+                    self._run_hashes[item_index]),
+                range(current_image_count, len(test_items)),
+                queue_depth=max(prefetch_depth, batch_size * concurrent_runs),
+                loader_count=max(1, prefetch_loaders))
+
+            # Items of (group name, image hash, image input) waiting for a
+            # sess.run, A batch is full when `batch_size` images need inference
+            # or it has `batch_size` images (cached ones waiting for a batch
+            # before them, so results are put in test data order)
+            batch = []
+            uncached_count = 0
+            # Up to `concurrent_runs` batches run on the shared session at a
+            # time, They are finished in order of submission (test data order)
+            in_flight = collections.deque()
+            with ThreadPoolExecutor(max_workers=concurrent_runs) as executor:
+                for item_index, (image_hash, image_input) in prefetcher:
+                    self._run_hashes[item_index] = image_hash
+                    group_name = test_items[item_index][0]
+                    batch.append((group_name, image_hash, image_input))
+                    if image_hash not in cached_hashes:
+                        uncached_count = uncached_count + 1
+                    elif uncached_count == 0 and len(in_flight) == 0:
+                        # Nothing is waiting for inference, The cached output
+                        # is put right away
+                        current_image_count = self._finish_batch(
+                            self._submit_batch(batch, inference_cache, model_key, executor),
+                            ret_dict, current_image_count, total_image_count,
+                            inference_cache, model_key)
+                        batch = []
+                        continue
+                    if uncached_count < batch_size and len(batch) < batch_size:
+                        continue
+
+                    if len(in_flight) >= concurrent_runs:
+                        current_image_count = self._finish_batch(
+                            in_flight.popleft(), ret_dict,
+                            current_image_count, total_image_count,
+                            inference_cache, model_key)
+                    in_flight.append(self._submit_batch(
+                        batch, inference_cache, model_key, executor))
+                    batch = []
+                    uncached_count = 0
+
+                # Rest of images which can't fill a batch
+                if len(batch) > 0:
+                    in_flight.append(self._submit_batch(
+                        batch, inference_cache, model_key, executor))
+
+                while len(in_flight) > 0:
+                    current_image_count = self._finish_batch(
+                        in_flight.popleft(), ret_dict,
+                        current_image_count, total_image_count,
+                        inference_cache, model_key)
+
+            if inference_cache is not None:
+                inference_cache.evict(
+                    self._config.get(CONFIG_KEY_INFERENCE_CACHE_BUDGET_MB,
+                                     get_type=int) * 1024 * 1024,
+                    self._config.get(CONFIG_KEY_INFERENCE_CACHE_MAX_AGE_DAYS,
+                                     get_type=int) * 24 * 60 * 60)
+
+            self.sigTestSessionResult.emit(ret_dict)
             self.sigTestSessionStatus.emit(SESSION_STATUS_PREDICTION_SUCCESS)
-        except:
+        except Exception as e:
+            self.sigTestSessionMessage.emit('Failed to predict: {}'.format(e))
             self.sigTestSessionStatus.emit(SESSION_STATUS_PREDICTION_FAILED)
+        finally:
+            self._close_journal()
+            if inference_cache is not None:
+                inference_cache.close()
 
-    def _filter_result_by_thres(self, source_dict, thres=0.5):
-        filtered_dict = dict()
-        scores = source_dict['detection_scores']
-        separate_index = -1
-        for index, score in enumerate(scores):
-            if score < thres:
-                separate_index = index
-                break
+    # Predict with group of images through tf.data pipeline in the graph,
+    # Images are read and batched by TF and never pass through python
+    @QtCore.pyqtSlot(str, dict)
+    def slot_predict_group_dataset(self, data_path: str, test_group: dict, resume=False):
+        self._run_items = []
+        self._run_hashes = []
+        self._run_stats = None
+        # Images are read from files, A pack of an earlier run is not used
+        self._packed_dataset = None
+        if self._model is None:
+            self.sigTestSessionStatus.emit(SESSION_STATUS_PREDICTION_FAILED)
+            return
+
+        self.sigTestSessionStatus.emit(SESSION_STATUS_PREDICTION_STARTED)
+
+        try:
+            total_image_count = self._get_total_image_count(test_group)
+            current_image_count = 0
+            prefetch_depth = 32
+            prefetch_loaders = 4
+            batch_size, _ = self._get_run_settings()
+            if self._config:
+                prefetch_depth = self._config.get(
+                    CONFIG_KEY_PREFETCH_DEPTH, get_type=int)
+                prefetch_loaders = self._config.get(
+                    CONFIG_KEY_PREFETCH_LOADERS, get_type=int)
+
+            runner = self._get_dataset_runner(
+                batch_size, prefetch_depth, max(1, prefetch_loaders))
+
+            ret_dict, test_items = self._get_test_items(test_group)
+            current_image_count = self._start_journal(
+                data_path, ret_dict, total_image_count, resume)
+            runner['sess'].run(runner['iterator'].initializer, feed_dict={
+                runner['filenames']: [os.path.join(data_path, *test_item)
+                                      for test_item in test_items[current_image_count:]]})
+
+            while current_image_count < total_image_count:
+                try:
+                    output_dict = runner['sess'].run(runner['tensor_dict'])
+                except tf.errors.OutOfRangeError:
+                    break
+
+                output_dicts = split_batch_outputs(output_dict)
+                group_names = [group_name for group_name, _ in test_items[
+                    current_image_count:current_image_count+len(output_dicts)]]
+                current_image_count = self._put_results(
+                    group_names, output_dicts, ret_dict,
+                    current_image_count, total_image_count)
+
+            self.sigTestSessionResult.emit(ret_dict)
+            self.sigTestSessionStatus.emit(SESSION_STATUS_PREDICTION_SUCCESS)
+        except Exception as e:
+            self.sigTestSessionMessage.emit('Failed to predict: {}'.format(e))
+            self.sigTestSessionStatus.emit(SESSION_STATUS_PREDICTION_FAILED)
+        finally:
+            self._close_journal()
+
+    # The loaded model is imported once more on its own graph with the
+    # output of a tf.data iterator as its input, It is kept with the model
+    # and rebuilt only when the pipeline options are changed
+    def _get_dataset_runner(self, batch_size, prefetch_depth, loader_count):
+        model = self._model
+        options = (batch_size, prefetch_depth, loader_count)
+        if model.dataset_runner is not None:
+            if model.dataset_runner['options'] == options:
+                return model.dataset_runner
+            model.dataset_runner['sess'].close()
+            model.dataset_runner = None
+
+        if model.input_type == INPUT_TYPE_TF_EXAMPLE:
+            raise ValueError(
+                'tf.data pipeline does not support `tf_example` input')
+
+        graph = tf.Graph()
+        sess = tf.Session(graph=graph, config=self._create_session_config(
+            dict(model.load_options[4])))
+        try:
+            with graph.as_default():
+                filenames = tf.placeholder(
+                    tf.string, shape=[None], name='test_suite_filenames')
+                dataset = tf.data.Dataset.from_tensor_slices(filenames)
+                if model.input_type == INPUT_TYPE_IMAGE_TENSOR:
+                    dataset = dataset.map(
+                        lambda filename: tf.image.decode_jpeg(
+                            tf.read_file(filename), channels=3),
+                        num_parallel_calls=loader_count)
+                else:
+                    dataset = dataset.map(
+                        tf.read_file, num_parallel_calls=loader_count)
+                dataset = dataset.batch(batch_size)
+                # Prefetch buffer is counted in batches
+                dataset = dataset.prefetch(
+                    max(1, prefetch_depth // batch_size))
+                iterator = dataset.make_initializable_iterator()
+                _import_model_graph(
+                    model, sess, input_map={model.input_type + ':0': iterator.get_next()})
+        except:
+            sess.close()
+            raise
+
+        model.dataset_runner = {
+            'options': options,
+            'sess': sess,
+            'filenames': filenames,
+            'iterator': iterator,
+            'tensor_dict': _get_output_tensor_dict(graph, model.metadata),
+        }
+        return model.dataset_runner
+
+    # Returns empty results by group and (group name, image file) of all images
+    def _get_test_items(self, test_group):
+        ret_dict = dict()
+        test_items = []
+        self._group_image_counts.clear()
+        self._stream_group_results = self._config is not None and \
+            self._config.get(CONFIG_KEY_STREAM_GROUP_RESULTS, get_type=bool)
+        self._open_detection_segment()
+        # The pack of the test data is opened for each run
+        self._packed_dataset = None
+        image_hashes = []
+        image_stats = []
+        for group_name, group_data in test_group.items():
+            if not 'test_data' in group_data:
+                continue
+            ret_dict[group_name] = self._create_output_store()
+            self._group_image_counts[group_name] = len(group_data['test_data'])
+            test_items.extend([(group_name, image_file)
+                               for image_file in group_data['test_data']])
+            image_hashes.extend(group_data.get(
+                'image_hashes', [None] * len(group_data['test_data'])))
+            if image_stats is not None and 'image_stats' in group_data:
+                image_stats.extend(group_data['image_stats'])
+            else:
+                image_stats = None
+
+        self._run_items = test_items
+        self._run_hashes = image_hashes
+        self._run_stats = image_stats
+        return ret_dict, test_items
+
+    # Start the journal of this run, When it is resumed, outputs journaled
+    # with same model and same test data are put to the results again and
+    # the count of them (they are the first items) is returned
+    def _start_journal(self, data_path, ret_dict, total_image_count, resume=False):
+        if self._config is None or \
+                not self._config.get(CONFIG_KEY_RUN_JOURNAL_ENABLED, get_type=bool):
+            if resume:
+                self.sigTestSessionMessage.emit(
+                    'The run journal is disabled, Started a new run.')
+            return 0
+
+        journal = RunJournal(
+            self._config.get_cache_file_path(RUN_JOURNAL_FILE_NAME))
+        if self._packed_dataset is not None:
+            snapshot = self._packed_dataset.snapshot
+        else:
+            snapshot = get_dataset_snapshot(
+                data_path, self._run_items, self._run_stats,
+                self._config.get(CONFIG_KEY_DATASET_SCAN_WORKERS, get_type=int))
+        records = []
+        if resume:
+            records = journal.resume(self.get_fingerprint(), snapshot)
+            self.sigTestSessionMessage.emit(
+                'Resumed {} of {} images from the journal.'.format(
+                    len(records), total_image_count))
+        else:
+            journal.start(self.get_fingerprint(), snapshot)
+
+        current_image_count = self._put_results(
+            [group_name for group_name, _, _ in records],
+            [output_dict for _, _, output_dict in records],
+            ret_dict, 0, total_image_count)
+
+        self._journal = journal
+        return current_image_count
+
+    # ((group name, image file), hash) of images of the last run,
+    # The hash is None if the image was not hashed
+    def get_run_image_hashes(self):
+        return list(zip(self._run_items, self._run_hashes))
+
+    def _close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    # Open a new segment for this run in bounded memory mode, The segment of
+    # the previous run is removed (its mapped arrays are still valid)
+    def _open_detection_segment(self):
+        if self._detection_segment is not None:
+            self._detection_segment.remove()
+            self._detection_segment = None
+
+        if self._config is None or \
+                not self._config.get(CONFIG_KEY_BOUNDED_MEMORY, get_type=bool):
+            return
+
+        self._remove_stale_detection_segments()
+        self._run_count = self._run_count + 1
+        self._detection_segment = DetectionSegment(
+            self._config.get_cache_file_path(DETECTION_SEGMENT_FILE_NAME.format(
+                pid=os.getpid(), run=self._run_count)))
+
+    # Remove segments left by processes which are not alive (crashed or
+    # not closed), Segments of other running apps are kept
+    def _remove_stale_detection_segments(self):
+        cache_path = os.path.dirname(
+            self._config.get_cache_file_path(DETECTION_SEGMENT_FILE_NAME))
+        for file_name in os.listdir(cache_path):
+            match = DETECTION_SEGMENT_FILE_PATTERN.match(file_name)
+            if match is None or _is_process_alive(int(match.group(1))):
+                continue
+            try:
+                os.remove(os.path.join(cache_path, file_name))
+            except OSError:
+                pass
+
+    # Open the detection segment of a run of which raw outputs are received
+    # from other processes (shards), Returns False if it's not in bounded
+    # memory mode
+    def open_detection_segment(self):
+        self._open_detection_segment()
+        return self._detection_segment is not None
+
+    # Copy raw outputs of a group to the detection segment, Returns the
+    # SpilledOutputStore of them
+    def spill_raw_outputs(self, raw_outputs):
+        spilled_outputs = SpilledOutputStore(self._detection_segment)
+        spilled_outputs.extend(raw_outputs)
+        return spilled_outputs
+
+    def _create_output_store(self):
+        if self._detection_segment is not None:
+            return SpilledOutputStore(self._detection_segment)
+        return RawOutputStore()
+
+    # Start a batch on the executor, Cached images and duplicated images in
+    # the batch are not inferred. Returns the pending batch for _finish_batch
+    # (The inference cache is used only in this thread)
+    def _submit_batch(self, batch, inference_cache, model_key, executor):
+        output_dicts = [None] * len(batch)
+        infer_indices = []
+        index_by_hash = dict()
+        for index, (_, image_hash, _) in enumerate(batch):
+            if image_hash is not None:
+                if image_hash in index_by_hash:
+                    continue
+                index_by_hash[image_hash] = index
+                if inference_cache is not None:
+                    output_dicts[index] = inference_cache.get(
+                        model_key, image_hash)
+            if output_dicts[index] is None:
+                infer_indices.append(index)
+
+        future = None
+        if len(infer_indices) > 0:
+            future = executor.submit(
+                self._run_batch, [batch[index][2] for index in infer_indices])
+
+        return batch, output_dicts, infer_indices, index_by_hash, future
+
+    # Wait a batch started by _submit_batch and put each result to its group,
+    # Returns updated count
+    def _finish_batch(self, pending_batch, ret_dict,
+                      current_image_count, total_image_count,
+                      inference_cache=None, model_key=None):
+        batch, output_dicts, infer_indices, index_by_hash, future = pending_batch
+        if future is not None:
+            for index, output_dict in zip(infer_indices, future.result()):
+                output_dicts[index] = output_dict
+                if inference_cache is not None:
+                    inference_cache.put(model_key, batch[index][1], output_dict)
+
+        # Same image in the batch shares its output
+        for index, (_, image_hash, _) in enumerate(batch):
+            if output_dicts[index] is None:
+                output_dicts[index] = output_dicts[index_by_hash[image_hash]]
+
+        return self._put_results(
+            [group_name for group_name, _, _ in batch], output_dicts, ret_dict,
+            current_image_count, total_image_count)
+
+    # Outputs can be reused only with same model (same graph of it) and
+    # same input to the model
+    def _get_inference_cache_key(self, feed_raw_bytes):
+        _, fingerprint, encoding_format, encoding_quality, _ = \
+            self._model.load_options
+        if self._model.optimized_graph_path is not None:
+            fingerprint = fingerprint + '/optimized'
+        if feed_raw_bytes or self._model.input_type == INPUT_TYPE_IMAGE_TENSOR:
+            return fingerprint + '/raw'
+        return '{}/{}{}'.format(fingerprint, encoding_format, encoding_quality)
+
+    # Put each raw result to its group, Returns updated count
+    # (Threshold is applied when the test result is built)
+    # In streaming mode, a finished group is emitted and removed from ret_dict
+    def _put_results(self, group_names, output_dicts, ret_dict,
+                     current_image_count, total_image_count):
+        for group_name, output_dict in zip(group_names, output_dicts):
+            if self._journal is not None:
+                self._journal.append(
+                    *self._run_items[current_image_count], output_dict)
+            ret_dict[group_name].append(output_dict)
+            if self._stream_group_results and \
+                    ret_dict[group_name].get_count() == self._group_image_counts[group_name]:
+                self.sigTestSessionGroupResult.emit(
+                    group_name, ret_dict.pop(group_name))
+
+            current_image_count = current_image_count + 1
+            self.sigTestSessionCount.emit(
+                current_image_count, total_image_count)
+
+        if self._journal is not None:
+            self._journal.flush()
+        return current_image_count
+
+    # Run inference with list of image inputs and split the batched outputs
+    # Images of a batch are run one at a time if it fails (ex: images of
+    # different size can't be batched), and so are the rest of the run
+    def _run_batch(self, image_inputs):
+        if len(image_inputs) > 1 and not self._single_image_runs:
+            try:
+                return self._run_images(image_inputs)
+            except (ValueError, tf.errors.OpError) as e:
+                self._single_image_runs = True
+                self.sigTestSessionMessage.emit(
+                    'Failed to run a batch of {} images, Images are run one at a time: {}'.format(
+                        len(image_inputs), e))
+
+        return [output_dict for image_input in image_inputs
+                for output_dict in self._run_images([image_input])]
+
+    def _run_images(self, image_inputs):
+        feed_dict = self._get_feed_dict(image_inputs)
+        output_dict = self._model.sess.run(
+            self._model.tensor_dict, feed_dict=feed_dict)
+
+        return split_batch_outputs(output_dict)
+
+    # Test data is read from the packed file if it exists in the test data
+    # directory, The packed file of the previous run is unmapped when its
+    # images are released
+    def _open_packed_dataset(self, data_path):
+        self._packed_dataset = None
+        packed_path = get_packed_dataset_path(data_path)
+        if packed_path is not None:
+            self._packed_dataset = PackedDataset(packed_path)
+
+    # Returns bytes of the image file or memoryview of the packed test data
+    def _read_image_bytes(self, data_path, test_item):
+        if self._packed_dataset is not None:
+            return self._packed_dataset.get_image(*test_item)
+
+        with open(os.path.join(data_path, *test_item), mode='rb') as f:
+            return f.read()
+
+    # Returns (SHA-256 of the image file or None, image input)
+    # `image_hash` is the known hash of an unchanged image, The image is not
+    # read at all if its outputs are cached. Cached images are not fed at
+    # all so their input is None
+    def _load_test_image(self, data_path, test_item, feed_raw_bytes=True,
+                         hash_image=False, cached_hashes=None, image_hash=None):
+        if image_hash is not None and cached_hashes is not None and \
+                image_hash in cached_hashes:
+            return image_hash, None
+
+        image_bytes = self._read_image_bytes(data_path, test_item)
+
+        if hash_image and image_hash is None:
+            image_hash = hashlib.sha256(image_bytes).hexdigest()
+
+        if cached_hashes is not None and image_hash in cached_hashes:
+            return image_hash, None
+
+        # Test data is only jpeg, so the bytes on disk are already the
+        # encoded image string which the model expects
+        if feed_raw_bytes and self._model.input_type != INPUT_TYPE_IMAGE_TENSOR:
+            return image_hash, bytes(image_bytes)
+
+        # Decode raw jpeg image to ndarray
+        return image_hash, self._decode_image(image_bytes)
+
+    # Make feed dict matched with the input type of loaded model
+    def _get_feed_dict(self, image_inputs):
+        if self._model.input_type == INPUT_TYPE_IMAGE_TENSOR:
+            # Arrays are fed as it is, no encode/decode round trip
+            return {self._model.image_tensor: np.stack([
+                self._decode_image(image_input) for image_input in image_inputs])}
+
+        if self._model.input_type == INPUT_TYPE_ENCODED_IMAGE_STRING and \
+                len(image_inputs) == 1 and isinstance(image_inputs[0], np.ndarray):
+            # Encoded by the cached encoder in the same run
+            return {self._model.encoder_input: image_inputs[0]}
+
+        encoded_images = [self._encode_image(image_input)
+                          for image_input in image_inputs]
+        if self._model.input_type == INPUT_TYPE_TF_EXAMPLE:
+            encoded_images = [_create_tf_example_string(encoded_image)
+                              for encoded_image in encoded_images]
+        return {self._model.image_tensor: encoded_images}
 
-        if separate_index != -1:
-            filtered_dict['num_detections'] = separate_index
-            filtered_dict['detection_classes'] = source_dict['detection_classes'][:separate_index]
-            filtered_dict['detection_boxes'] = source_dict['detection_boxes'][:separate_index]
-            filtered_dict['detection_scores'] = source_dict['detection_scores'][:separate_index]
+    def _decode_image(self, image_input):
+        if isinstance(image_input, np.ndarray):
+            return image_input
+        if isinstance(image_input, (bytes, memoryview)):
+            image_input = Image.open(io.BytesIO(image_input))
+        return np.asarray(image_input.convert('RGB'))
 
-        return filtered_dict
+    def _encode_image(self, image_input):
+        if isinstance(image_input, np.ndarray):
+            return self._model.sess.run(self._model.encoded_string, feed_dict={
+                self._model.encoder_input: image_input})
+        return image_input
 
     def _get_total_image_count(self, test_group):
         total_image_count = 0
@@ -4,23 +4,45 @@ from PyQt5 import QtCore
 import numpy as np
 import cv2
 import os
-import json
+import functools
 
 from PIL import Image
 from config import Config
 from config import CONFIG_KEY_SAVED_MODEL_PATH
 from config import CONFIG_KEY_LABEL_MAP_PATH
 from config import CONFIG_KEY_TEST_DATA_PATH
+from config import CONFIG_KEY_RESULT_CUTOFF_THRESHOLD
+from config import CONFIG_KEY_INPUT_PIPELINE
+from config import INPUT_PIPELINE_DATASET
+from config import CONFIG_KEY_BOUNDED_MEMORY
+from config import CONFIG_KEY_INCREMENTAL_RETEST
+from config import CONFIG_KEY_DATASET_SCAN_WORKERS
+from config import CONFIG_KEY_RUN_JOURNAL_ENABLED
+from config import CONFIG_KEY_STREAM_GROUP_RESULTS
+from config import CONFIG_KEY_SHARD_COUNT
+from config import CONFIG_KEY_SHARD_INTRA_OP_THREADS
+from dataset_index import DatasetIndex, get_dataset_index_file_name
+from dataset_manifest import DatasetManifest, get_dataset_manifest_file_name
+from packed_dataset import PackedDataset, get_packed_dataset_path
 from label_map_loader import LabelMapLoader
-from test_result import TestResult, TestResultGroup, TestResultImage, TestResultClass
+from test_result import TestResult, ColumnarTestResult, SpilledTestResult
 from test_session import TestSession
+from sharded_runner import ShardedRunner
 import test_session
 import mainwindow
 
+# Tasks which the worker runs in background
+WORKER_TASK_PRELOAD = 'preload'
+WORKER_TASK_RUN = 'run'
+WORKER_TASK_AUTOTUNE = 'autotune'
+
 
 class TestWorker(QtCore.QThread):
     sig_result = QtCore.pyqtSignal(TestResult)
+    # Result of a finished group in streaming mode
+    sig_group_result = QtCore.pyqtSignal(TestResult)
     sig_ui_event = QtCore.pyqtSignal(int, int)
+    sig_log_message = QtCore.pyqtSignal(str)
 
     def __init__(self, parent=None, config=None):
         super().__init__(parent)
@@ -28,11 +50,22 @@ class TestWorker(QtCore.QThread):
         self._session = TestSession(config=config)
         self._label_map_loader = LabelMapLoader()
         self._test_groups = dict()
+        # Index of the test data of current run in incremental mode
+        self._dataset_index = None
+        self._preload_only = False
+        self._autotune_only = False
+        self._resume = False
+        self._task = None
+        # Whether raw outputs of all groups are stored by the last run
+        self._has_result = False
 
         # Make connection between worker and session
         self._session.sigTestSessionStatus.connect(self.log_session_status)
         self._session.sigTestSessionResult.connect(self.log_session_result)
+        self._session.sigTestSessionGroupResult.connect(
+            self.log_session_group_result)
         self._session.sigTestSessionCount.connect(self.log_session_count)
+        self._session.sigTestSessionMessage.connect(self.sig_log_message)
 
     def set_config(self, config):
         self._config = config
@@ -42,17 +75,57 @@ class TestWorker(QtCore.QThread):
         return self._config
 
     def start(self, loop=False):
+        self._task = WORKER_TASK_RUN
         super().start(QtCore.QThread.LowPriority)
 
+    # Task running in background, None if the worker is not running
+    def get_task(self):
+        if not self.isRunning():
+            return None
+        return self._task
+
+    # Load the saved model in background, It is kept for the next run
+    def preload_saved_model(self):
+        if self.isRunning():
+            return False
+        self._preload_only = True
+        self._task = WORKER_TASK_PRELOAD
+        super().start(QtCore.QThread.LowPriority)
+        return True
+
+    # Tune session settings of the model with the test data in background,
+    # Tuned settings are used by later runs of the model
+    def autotune(self):
+        if self.isRunning():
+            return False
+        self._autotune_only = True
+        self._task = WORKER_TASK_AUTOTUNE
+        super().start(QtCore.QThread.LowPriority)
+        return True
+
+    # Run again skipping images journaled by the interrupted run
+    def resume(self):
+        if self.isRunning():
+            return False
+        self._resume = True
+        self._task = WORKER_TASK_RUN
+        super().start(QtCore.QThread.LowPriority)
+        return True
+
+    # Remove files of the session, Called when the app is shut down
+    def close(self):
+        self._session.close()
+
     def stop(self):
         raise NotImplementedError(
             'stop() method not implemented, It is not necessary')
 
-    def _prepare(self):
+    def _prepare(self, load_saved_model=True):
         if self._config is None:
             raise ValueError('There is no exist the config for preparing')
 
-        self._load_saved_model()
+        if load_saved_model:
+            self._load_saved_model()
         self._load_label_map()
         self._build_test_group()
 
@@ -79,38 +152,140 @@ class TestWorker(QtCore.QThread):
 
         # Clear old test group
         self._test_groups.clear()
-
-        # Retrieve group by directory name
-        test_groups = [name for name in os.listdir(test_data_path)
-                       if os.path.isdir(os.path.join(test_data_path, name))]
-
-        # Build test data and classes in each group
-        for group_name in test_groups:
+        self._dataset_index = None
+
+        # Packed test data has hashes of all images already
+        packed_path = get_packed_dataset_path(test_data_path)
+        if packed_path is not None:
+            for group_name, group_data in PackedDataset(packed_path).get_test_groups().items():
+                self._test_groups[group_name] = {'results': []}
+                self._test_groups[group_name].update(group_data)
+            return
+
+        if self._config.get(CONFIG_KEY_INCREMENTAL_RETEST, get_type=bool):
+            self._dataset_index = DatasetIndex(self._config.get_cache_file_path(
+                get_dataset_index_file_name(test_data_path)))
+
+        # Retrieve group by directory name, from the manifest if the test
+        # data directories are not changed
+        manifest = DatasetManifest(
+            self._config.get_cache_file_path(
+                get_dataset_manifest_file_name(test_data_path)),
+            self._config.get(CONFIG_KEY_DATASET_SCAN_WORKERS, get_type=int))
+
+        # Build test data and classes in each group, Images are stat-ed by
+        # the scan workers for the index and the snapshot of the journal
+        test_groups = manifest.load(test_data_path, image_stats=(
+            self._dataset_index is not None or
+            self._config.get(CONFIG_KEY_RUN_JOURNAL_ENABLED, get_type=bool)))
+        for group_name, group_data in test_groups.items():
             self._test_groups[group_name] = {'results': []}
-            image_file_list = os.listdir(
-                os.path.join(test_data_path, group_name))
-            image_file_list = list(
-                filter(lambda image_file: image_file.lower().endswith(".jpg"), image_file_list))
-            if image_file_list is not None and len(image_file_list) > 0:
-                image_file_list.sort()
-                self._test_groups[group_name].update(
-                    {'test_data': image_file_list})
-            else:
-                del self._test_groups[group_name]
-                continue
-
-            with open(os.path.join(test_data_path, group_name, 'classes.json'), mode='r', encoding='utf-8') as f:
-                loaded_classes = json.load(f)
-                self._test_groups[group_name].update(
-                    {'classes': loaded_classes['classes']})
+            self._test_groups[group_name].update(group_data)
+            if self._dataset_index is not None:
+                self._test_groups[group_name].update({'image_hashes': [
+                    self._dataset_index.add(group_name + '/' + image_file, size, mtime_ns)
+                    for image_file, (size, mtime_ns)
+                    in zip(group_data['test_data'], group_data['image_stats'])]})
+
+    # Keep hashes of images read in this run for the next run
+    def _save_dataset_index(self, image_hashes):
+        if self._dataset_index is None:
+            return
+
+        for (group_name, image_file), image_hash in image_hashes:
+            if image_hash is not None:
+                self._dataset_index.set_hash(
+                    group_name + '/' + image_file, image_hash)
+        self._dataset_index.save()
 
     def run(self):
         # print('Run TestWorker')
+        if self._preload_only:
+            self._preload_only = False
+            self._load_saved_model()
+            return
+
+        if self._autotune_only:
+            self._autotune_only = False
+            self._run_autotune()
+            return
+
+        resume = self._resume
+        self._resume = False
+
+        # Model is loaded by each process in sharded mode
+        shard_count = self._config.get(CONFIG_KEY_SHARD_COUNT, get_type=int)
+
         # Prepare
-        self._prepare()
+        self._has_result = False
+        self._prepare(load_saved_model=shard_count <= 1)
         data_path = self._config.get(CONFIG_KEY_TEST_DATA_PATH)
         # Prediction with test group data
-        self._session.slot_predict_group(data_path, self._test_groups)
+        use_dataset_pipeline = \
+            self._config.get(CONFIG_KEY_INPUT_PIPELINE) == INPUT_PIPELINE_DATASET
+        if use_dataset_pipeline and get_packed_dataset_path(data_path) is not None:
+            self.sig_log_message.emit(
+                'Packed test data is read by the python input pipeline.')
+            use_dataset_pipeline = False
+
+        if shard_count > 1:
+            if resume:
+                self.sig_log_message.emit(
+                    'Sharded run can not be resumed, Started a new run.')
+            self._run_sharded(data_path, shard_count, use_dataset_pipeline)
+            self._save_dataset_index([])
+            return
+
+        if use_dataset_pipeline:
+            self._session.slot_predict_group_dataset(
+                data_path, self._test_groups, resume)
+        else:
+            self._session.slot_predict_group(
+                data_path, self._test_groups, resume)
+        self._save_dataset_index(self._session.get_run_image_hashes())
+
+    def _run_autotune(self):
+        self.sig_ui_event.emit(mainwindow.UI_EVENT_AUTOTUNE_STARTED, 0)
+        try:
+            self._prepare()
+            data_path = self._config.get(CONFIG_KEY_TEST_DATA_PATH)
+            self._session.autotune_session_settings(data_path, self._test_groups)
+            self._session.autotune_run_settings(data_path, self._test_groups)
+            self.sig_ui_event.emit(mainwindow.UI_EVENT_AUTOTUNE_END_WITH_SUCCESS, 0)
+        except Exception as e:
+            self.sig_log_message.emit('Failed to autotune: {}'.format(e))
+            self.sig_ui_event.emit(mainwindow.UI_EVENT_AUTOTUNE_END_WITH_FAILED, 0)
+
+    # Run test groups in processes, Their progress and results are handled
+    # as those of the session in this thread
+    def _run_sharded(self, data_path, shard_count, use_dataset_pipeline):
+        self.log_session_status(test_session.SESSION_STATUS_PREDICTION_STARTED)
+        if self._config.get(CONFIG_KEY_STREAM_GROUP_RESULTS, get_type=bool):
+            log_group_result = self.log_session_group_result
+        else:
+            def log_group_result(group_name, raw_outputs):
+                self.log_session_result({group_name: raw_outputs})
+
+        # Shards keep outputs in memory, Received groups are spilled to the
+        # detection segment of the session in bounded memory mode
+        if self._session.open_detection_segment():
+            def on_group_result(group_name, raw_outputs):
+                log_group_result(group_name, self._session.spill_raw_outputs(raw_outputs))
+        else:
+            on_group_result = log_group_result
+
+        succeeded = False
+        try:
+            runner = ShardedRunner(shard_count, self._config.get(
+                CONFIG_KEY_SHARD_INTRA_OP_THREADS, get_type=int))
+            succeeded = runner.run(
+                self._config.get(CONFIG_KEY_SAVED_MODEL_PATH), data_path,
+                self._test_groups, self.log_session_count, on_group_result,
+                use_dataset_pipeline)
+        finally:
+            self.log_session_status(
+                test_session.SESSION_STATUS_PREDICTION_SUCCESS if succeeded
+                else test_session.SESSION_STATUS_PREDICTION_FAILED)
 
     def log_session_status(self, value: int):
         if test_session.SESSION_STATUS_LOAD_SUCCESS == value:
@@ -122,6 +297,7 @@ class TestWorker(QtCore.QThread):
         elif test_session.SESSION_STATUS_PREDICTION_STARTED == value:
             self.sig_ui_event.emit(mainwindow.UI_EVENT_PREDICTION_STARTED, 0)
         elif test_session.SESSION_STATUS_PREDICTION_SUCCESS == value:
+            self._has_result = True
             self.sig_result.emit(self._bulid_test_result())
             self.sig_ui_event.emit(
                 mainwindow.UI_EVENT_PREDICTION_END_WITH_SUCCESS, 0)
@@ -129,69 +305,99 @@ class TestWorker(QtCore.QThread):
             self.sig_ui_event.emit(
                 mainwindow.UI_EVENT_PREDICTION_END_WITH_FAILED, 0)
 
+    # Build the test result again from stored raw outputs with current
+    # threshold, It doesn't need to run inference again
+    def rescore_test_result(self):
+        if self.isRunning() or not self._has_result:
+            return False
+        self.sig_result.emit(self._bulid_test_result())
+        return True
+
     def log_session_result(self, value):
         for result_key, result_value in value.items():
             self._test_groups[result_key]['results'] = result_value
 
+    def log_session_group_result(self, group_name, raw_outputs):
+        group_data = self._test_groups[group_name]
+        group_data['results'] = raw_outputs
+
+        # Live results would keep all detections in memory
+        if self._config.get(CONFIG_KEY_BOUNDED_MEMORY, get_type=bool):
+            return
+
+        self.sig_group_result.emit(self._build_group_result(
+            group_name, group_data,
+            self._config.get(CONFIG_KEY_TEST_DATA_PATH),
+            self._config.get(CONFIG_KEY_RESULT_CUTOFF_THRESHOLD, get_type=float)))
+
     def log_session_count(self, count, total_count):
         percent = int((count / total_count)*100)
         self.sig_ui_event.emit(
             mainwindow.UI_EVENT_PREDICTION_PROGRESS_VALUE, percent)
 
     def _bulid_test_result(self):
-        passed_count = 0
-        tested_count = 0
+        test_data_path = self._config.get(CONFIG_KEY_TEST_DATA_PATH)
+        cutoff_thres = self._config.get(
+            CONFIG_KEY_RESULT_CUTOFF_THRESHOLD, get_type=float)
 
-        result = TestResult()
-        result.group = list()
+        if self._config.get(CONFIG_KEY_BOUNDED_MEMORY, get_type=bool):
+            return self._build_spilled_test_result(test_data_path, cutoff_thres)
 
-        test_data_path = self._config.get(CONFIG_KEY_TEST_DATA_PATH)
+        result = ColumnarTestResult()
+        for group_name, group_data in self._test_groups.items():
+            self._append_result_group(
+                result, group_name, group_data, test_data_path, cutoff_thres)
 
+        return result
+
+    # Only counts of each group are kept, Detections are read from the spilled
+    # raw outputs group by group and built again when the group is viewed
+    def _build_spilled_test_result(self, test_data_path, cutoff_thres):
+        result = SpilledTestResult()
         for group_name, group_data in self._test_groups.items():
-            result_group = TestResultGroup()
-            result_group.name = group_name
-            result_group.required_classes = self._get_names_by_labels(
-                group_data['classes'])
-            result_group.images = list()
-
-            set_of_required_classes = set(group_data['classes'])
-            non_passed_group = False
-
-            for test_file_name, prediction_result in zip(group_data['test_data'], group_data['results']):
-                result_image = TestResultImage()
-                result_image.name = test_file_name
-                result_image.filepath = os.path.join(
-                    test_data_path, group_name, test_file_name)
-                result_image.classes = list()
-
-                for label, score, box in zip(prediction_result['detection_classes'], prediction_result['detection_scores'], prediction_result['detection_boxes']):
-                    result_class = TestResultClass()
-                    result_class.name = self._get_name_by_label(label)
-                    result_class.label = label.tolist()  # ndarray to list
-                    result_class.score = score.tolist()  # ndarray to list
-                    result_class.box = box.tolist()     # ndarray to list
-                    result_image.classes.append(result_class)
-
-                if len(set_of_required_classes-set(prediction_result['detection_classes'].tolist())) == 0:
-                    passed_count = passed_count + 1
-                else:
-                    non_passed_group = True
-
-                result_image.sort_classes()
-                result_group.images.append(result_image)
-                tested_count = tested_count + 1
-
-            if non_passed_group:
-                # Append to front
-                result.group.insert(0, result_group)
-            else:
-                result.group.append(result_group)
-
-        result.passed_count = passed_count
-        result.tested_count = tested_count
+            group_result = self._build_group_result(
+                group_name, group_data, test_data_path, cutoff_thres)
+            group_data['results'].release()
+
+            result.append_group(
+                group_name,
+                group_result.group_required_classes[0],
+                group_result.passed_count,
+                group_result.tested_count,
+                functools.partial(self._build_group_result,
+                                  group_name, group_data, test_data_path, cutoff_thres))
 
         return result
 
+    def _build_group_result(self, group_name, group_data, test_data_path, cutoff_thres):
+        group_result = ColumnarTestResult()
+        self._append_result_group(
+            group_result, group_name, group_data, test_data_path, cutoff_thres)
+        return group_result
+
+    def _append_result_group(self, result, group_name, group_data, test_data_path, cutoff_thres):
+        image_index, labels, scores, boxes = \
+            group_data['results'].get_filtered_arrays(thres=cutoff_thres)
+
+        # An image is passed when all of required classes are found
+        image_passed = np.ones(len(group_data['test_data']), dtype=bool)
+        for required_label in set(group_data['classes']):
+            found = np.zeros(len(group_data['test_data']), dtype=bool)
+            found[image_index[labels == required_label]] = True
+            image_passed &= found
+
+        for label in np.unique(labels).tolist():
+            if label not in result.label_names:
+                result.label_names[label] = self._get_name_by_label(label)
+
+        result.append_group(
+            group_name,
+            self._get_names_by_labels(group_data['classes']),
+            group_data['test_data'],
+            [os.path.join(test_data_path, group_name, test_file_name)
+             for test_file_name in group_data['test_data']],
+            image_index, labels, scores, boxes, image_passed)
+
     def _get_name_by_label(self, label):
         return self._label_map_loader.get_label_name_by_id_index(int(label))
 
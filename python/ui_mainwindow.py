@@ -236,13 +236,19 @@ class Ui_MainWindow(object):
         self.actionRun.setObjectName("actionRun")
         self.actionResult = QtWidgets.QAction(MainWindow)
         self.actionResult.setObjectName("actionResult")
+        self.actionResume = QtWidgets.QAction(MainWindow)
+        self.actionResume.setObjectName("actionResume")
+        self.actionAutotune = QtWidgets.QAction(MainWindow)
+        self.actionAutotune.setObjectName("actionAutotune")
         self.menuFile.addAction(self.actionOpen_Saved_Model_Path)
         self.menuFile.addAction(self.actionOpen_Labelmap_Path)
         self.menuFile.addAction(self.actionOpen_Testdata_Path)
         self.menuFile.addSeparator()
         self.menuFile.addAction(self.actionExit)
         self.menuTest.addAction(self.actionRun)
+        self.menuTest.addAction(self.actionResume)
         self.menuTest.addAction(self.actionResult)
+        self.menuTest.addAction(self.actionAutotune)
         self.menuBar.addAction(self.menuFile.menuAction())
         self.menuBar.addAction(self.menuTest.menuAction())
 
@@ -273,4 +279,6 @@ class Ui_MainWindow(object):
         self.actionExit.setText(_translate("MainWindow", "Exit"))
         self.actionRun.setText(_translate("MainWindow", "Run"))
         self.actionResult.setText(_translate("MainWindow", "Result"))
+        self.actionResume.setText(_translate("MainWindow", "Resume"))
+        self.actionAutotune.setText(_translate("MainWindow", "Autotune"))
 